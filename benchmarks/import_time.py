@@ -0,0 +1,69 @@
+"""
+Benchmark del tiempo de importación del orquestador.
+
+Verifica que `import src.process` y la carga de una etapa liviana
+(IPC) se mantengan dentro del presupuesto y que no arrastren las
+dependencias pesadas (geopandas, matplotlib, statsmodels, scikit-learn).
+
+Uso:
+    python benchmarks/import_time.py
+"""
+import subprocess
+import sys
+
+# Presupuesto en segundos (mínimo de varias corridas en un proceso nuevo)
+IMPORT_BUDGET_S = 0.5
+STAGE_BUDGET_S = 1.0
+REPEATS = 5
+HEAVY_MODULES = ['geopandas', 'matplotlib', 'statsmodels', 'sklearn']
+
+SNIPPETS = {
+    'import src.process': (
+        IMPORT_BUDGET_S,
+        "import src.process"
+    ),
+    'etapa cpi': (
+        STAGE_BUDGET_S,
+        "from src.pipeline import load_callable; "
+        "load_callable('src.processors.prices:process_cpi')"
+    ),
+}
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(elapsed, ','.join(heavy))
+"""
+
+
+def measure(code):
+    """Devuelve (mejor tiempo, módulos pesados cargados)"""
+    best, heavy = float('inf'), ''
+    for _ in range(REPEATS):
+        out = subprocess.run(
+            [sys.executable, '-c', PROBE.format(code=code, heavy=HEAVY_MODULES)],
+            capture_output=True, text=True, check=True
+        ).stdout.split()
+        best = min(best, float(out[0]))
+        heavy = out[1] if len(out) > 1 else ''
+    return best, heavy
+
+
+def main():
+    failed = False
+    for name, (budget, code) in SNIPPETS.items():
+        elapsed, heavy = measure(code)
+        ok = elapsed <= budget and not heavy
+        failed |= not ok
+        status = '✓' if ok else '✗'
+        print(f"{status} {name}: {elapsed:.3f}s (presupuesto {budget:.2f}s)")
+        if heavy:
+            print(f"  Dependencias pesadas importadas: {heavy}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
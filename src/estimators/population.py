@@ -1,11 +1,64 @@
 """
 Estimaciones y proyecciones poblacionales
 """
-from ..utils.io import ensure_dir, read_file
+from ..utils.io import read_file, save_with_metadata
 from ..utils.validations import validate_non_empty, check_required_columns
+import numpy as np
 import pandas as pd
-import os
-import yaml
+
+CENSUS_YEARS = (1996, 2011, 2023)
+RATE_COLUMNS = ('Tasa 1996-2011', 'Tasa 2011-2023')
+
+def project_population_matrix(census, rates, years, census_years=CENSUS_YEARS):
+    """
+    Proyección de todas las unidades y años en un solo cálculo vectorizado.
+
+    - Interpolación lineal entre los censos que caen dentro de `years`
+      (antes del primero queda NaN, después del último se repite su valor,
+      igual que `Series.interpolate`).
+    - Antes del primer censo y después del último: crecimiento
+      exponencial con la primera y la última tasa.
+
+    Args:
+        census: Arreglo unidades × censos con la población censal
+        rates: Arreglo unidades × 2 (tasa anterior y posterior)
+        years: Años a proyectar (consecutivos)
+        census_years: Años de los censos (columnas de `census`)
+
+    Returns:
+        Arreglo float64 unidades × años
+    """
+    census = np.asarray(census, dtype=np.float64)
+    rates = np.asarray(rates, dtype=np.float64)
+    years = np.asarray(years, dtype=np.int64)
+    census_years = np.asarray(census_years, dtype=np.int64)
+
+    # Censos dentro del rango: puntos de la interpolación
+    known = np.isin(census_years, years)
+    xp, fp = census_years[known], census[:, known]
+    result = np.full((census.shape[0], len(years)), np.nan)
+
+    if len(xp) > 0:
+        # Segmento de cada año (mismo cálculo que np.interp)
+        j = np.clip(np.searchsorted(xp, years, side='right') - 1, 0, max(len(xp) - 2, 0))
+        if len(xp) > 1:
+            slope = (fp[:, j + 1] - fp[:, j]) / (xp[j + 1] - xp[j])
+            inner = slope * (years - xp[j]) + fp[:, j]
+        else:
+            inner = np.broadcast_to(fp[:, [0]], result.shape)
+        inside = (years >= xp[0]) & (years <= xp[-1])
+        result[:, inside] = inner[:, inside]
+        # Los años censales conservan el valor exacto
+        result[:, np.searchsorted(years, xp)] = fp
+        # Después del último censo del rango se repite su valor
+        result[:, years > xp[-1]] = fp[:, [-1]]
+
+    # Extrapolación exponencial fuera del rango censal
+    first, last = census_years[0], census_years[-1]
+    pre, post = years < first, years > last
+    result[:, pre] = census[:, [0]] * (1 + rates[:, [0]]) ** (years[pre] - first)
+    result[:, post] = census[:, [-1]] * (1 + rates[:, [1]]) ** (years[post] - last)
+    return result
 
 def project_population(input_path, output_path, years_params):
     """Proyecta población departamental"""
@@ -16,52 +69,23 @@ def project_population(input_path, output_path, years_params):
     validate_non_empty(df, "Población")
     check_required_columns(df, ['Departamento', '1996', '2011', '2023'])
     
-    # Obtener años de proyección
-    años_completos = range(years_params['start'], years_params['end'] + 1)
+    # Un registro por departamento, en el orden de columnas final
+    df = df.drop_duplicates('Departamento').sort_values('Departamento')
     
-    # Proyectar población
-    df_proyectado = pd.DataFrame()
+    # Censos y tasas como arreglos departamentos × censos
+    census = df[[str(year) for year in CENSUS_YEARS]].astype('int64').to_numpy()
+    rates = df[list(RATE_COLUMNS)].astype('float64').to_numpy()
+    años = pd.RangeIndex(years_params['start'], years_params['end'] + 1, name='año')
     
-    for depto in df['Departamento'].unique():
-        depto_df = df[df['Departamento'] == depto].copy()
-        
-        # Crear serie temporal completa
-        anual_df = pd.DataFrame({'año': años_completos})
-        
-        # Mapear datos censales conocidos
-        censos = {
-            1996: int(depto_df['1996'].values[0]),
-            2011: int(depto_df['2011'].values[0]),
-            2023: int(depto_df['2023'].values[0])
-        }
-        
-        # Interpolación lineal entre censos
-        anual_df['poblacion'] = anual_df['año'].apply(lambda x: censos.get(x, None))
-        anual_df['poblacion'] = anual_df['poblacion'].interpolate(method='linear')
-        
-        # Extrapolación usando tasas de crecimiento
-        tasa_pre = float(depto_df['Tasa 1996-2011'].values[0])
-        tasa_post = float(depto_df['Tasa 2011-2023'].values[0])
-        
-        # Proyección pre-1996
-        mask_pre = anual_df['año'] < 1996
-        anual_df.loc[mask_pre, 'poblacion'] = censos[1996] * (1 + tasa_pre) ** (anual_df.loc[mask_pre, 'año'] - 1996)
-        
-        # Proyección post-2023
-        mask_post = anual_df['año'] > 2023
-        anual_df.loc[mask_post, 'poblacion'] = censos[2023] * (1 + tasa_post) ** (anual_df.loc[mask_post, 'año'] - 2023)
-        
-        # Convertir todas las poblaciones a enteros después de todas las proyecciones
-        anual_df['poblacion'] = anual_df['poblacion'].round().astype(int)
-        
-        anual_df['departamento'] = depto
-        df_proyectado = pd.concat([df_proyectado, anual_df])
+    projected = project_population_matrix(census, rates, años.to_numpy())
+    if pd.isna(projected).any():
+        raise ValueError("La proyección tiene años sin datos: el rango debe incluir el primer censo")
     
-    # Pivotar para formato final
-    df_final = df_proyectado.pivot(
-        index='año',
-        columns='departamento',
-        values='poblacion'
+    # Convertir todas las poblaciones a enteros después de todas las proyecciones
+    df_final = pd.DataFrame(
+        projected.round().astype(int).T,
+        index=pd.Index(años, name='año'),
+        columns=pd.Index(df['Departamento'].to_numpy(), name='departamento')
     )
     
     # Crear metadata
@@ -90,13 +114,7 @@ def project_population(input_path, output_path, years_params):
         }
     }
     
-    # Guardar resultados
-    ensure_dir(os.path.dirname(output_path))
-    df_final.to_csv(output_path)
-    
-    # Guardar metadata
-    metadata_path = os.path.join(os.path.dirname(output_path), 'metadata.yaml')
-    with open(metadata_path, 'w', encoding='utf-8') as f:
-        yaml.dump(metadata, f, allow_unicode=True, sort_keys=False)
+    # Guardar resultados con metadata embebida
+    save_with_metadata(df_final, output_path, metadata, index=True)
     
     return df_final, metadata
\ No newline at end of file
@@ -2,11 +2,9 @@
 Estimación del PIB departamental usando participación proyectada
 y PIB nacional histórico/proyectado
 """
-from ..utils.io import ensure_dir, read_file
+from ..utils.io import load_data_with_metadata, load_input, save_with_metadata
 from ..utils.validations import validate_non_empty
 import pandas as pd
-import os
-import yaml
 
 def estimate_subnational_gdp(
     gdp_share_path,
@@ -20,20 +18,32 @@ def estimate_subnational_gdp(
     - PIB nacional histórico/proyectado (USD constantes)
     
     PIB_depto = (Participación_depto/100) * PIB_nacional
+
+    Ambas entradas pueden ser rutas o los objetos publicados en memoria
+    por las etapas previas (participación con índice=año y PIB nacional
+    como serie indexada por año).
     """
     print("\nEstimando PIB departamental...")
     
     # 1. Cargar y validar datos
-    df_share = read_file(gdp_share_path)
-    df_gdp = read_file(national_gdp_path, index_col='year')
+    if isinstance(gdp_share_path, pd.DataFrame):
+        df_share = gdp_share_path.copy()
+        # Mismos nombres de ejes que al leer desde CSV
+        df_share.index.name = None
+        df_share.columns.name = 'departamento'
+    else:
+        # Reestructurar df_share (en disco se guarda con departamentos por fila)
+        df_share = load_data_with_metadata(gdp_share_path).set_index('departamento').T
+        df_share.index = pd.to_numeric(df_share.index)
+
+    if isinstance(national_gdp_path, pd.Series):
+        df_gdp = national_gdp_path.to_frame('gdp')
+    else:
+        df_gdp = load_input(national_gdp_path, index_col='year')
     
     validate_non_empty(df_share, "Participación PIB")
     validate_non_empty(df_gdp, "PIB nacional")
     
-    # Reestructurar df_share
-    df_share = df_share.set_index('departamento').T
-    df_share.index = pd.to_numeric(df_share.index)
-    
     # 2. Alinear años
     common_years = df_share.index.intersection(df_gdp.index)
     
@@ -54,12 +64,7 @@ def estimate_subnational_gdp(
     print("\nValidación de totales:")
     print(validation)
     
-    # 5. Guardar resultados
-    ensure_dir(os.path.dirname(output_path))
-    df_final.to_csv(output_path)
-    print(f"\nResultados guardados en: {output_path}")
-    
-    # 6. Crear metadata
+    # 5. Crear metadata
     start_year = int(common_years.min())
     end_year = int(common_years.max())
     
@@ -89,9 +94,8 @@ def estimate_subnational_gdp(
         }
     }
     
-    metadata_path = os.path.join(os.path.dirname(output_path), 'metadata.yaml')
-    with open(metadata_path, 'w', encoding='utf-8') as f:
-        yaml.dump(metadata, f, allow_unicode=True, sort_keys=False)
-    print(f"Metadata guardada en: {metadata_path}")
+    # 6. Guardar resultados con metadata embebida
+    save_with_metadata(df_final, output_path, metadata, index=True)
+    print(f"\nResultados guardados en: {output_path}")
     
     return df_final, metadata
\ No newline at end of file
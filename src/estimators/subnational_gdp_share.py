@@ -4,13 +4,10 @@ utilizando un modelo de panel con efectos fijos por departamento
 y la proporción de población como variable auxiliar,
 reinsertando datos reales (2008–2014) antes de la normalización final.
 """
-from ..utils.io import ensure_dir, read_file
+from ..utils.io import load_input, save_with_metadata
 from ..utils.validations import validate_non_empty, check_required_columns
 import pandas as pd
 import numpy as np
-import statsmodels.api as sm
-import os
-import yaml
 
 def project_subnational_gdp_share(
     input_path,
@@ -45,10 +42,11 @@ def project_subnational_gdp_share(
 
     Parámetros
     ----------
-    input_path : str
-        CSV con [departamento, año, participacion] (ej. 2008–2014).
-    population_path : str
-        CSV con índice='año', columnas=departamentos, valores=población (1990..2024).
+    input_path : str o pd.DataFrame
+        CSV (o DataFrame en memoria) con [departamento, año, participacion] (ej. 2008–2014).
+    population_path : str o pd.DataFrame
+        CSV (o DataFrame en memoria) con índice='año', columnas=departamentos,
+        valores=población (1990..2024).
     output_path : str
         Ruta de salida para CSV y metadatos.
     years_params : dict
@@ -69,25 +67,28 @@ def project_subnational_gdp_share(
       John Wiley & Sons, p. 16.
     """
 
+    # Import diferido: statsmodels es pesado y solo lo usa esta etapa
+    import statsmodels.api as sm
+
     print("Proyectando participación departamental en PIB con modelo de panel (efectos fijos)...")
 
     # --------------------------------------------------------------------------
     # 1. Leer y validar datos de participación
     # --------------------------------------------------------------------------
-    df_part = read_file(input_path)
+    df_part = load_input(input_path)
     validate_non_empty(df_part, "Participación PIB")
     check_required_columns(df_part, ['departamento', 'año', 'participacion'])
     df_part['año'] = df_part['año'].astype(int)
     df_part.dropna(subset=['departamento', 'año', 'participacion'], inplace=True)
-    print(f"Datos de participación cargados y validados desde: {input_path}")
+    print("Datos de participación cargados y validados")
 
     # --------------------------------------------------------------------------
     # 2. Leer y validar datos de población
     # --------------------------------------------------------------------------
-    df_pop = read_file(population_path, index_col='año')
+    df_pop = load_input(population_path, index_col='año')
     validate_non_empty(df_pop, "Población")
     df_pop.index = df_pop.index.map(int)
-    print(f"Datos de población cargados desde: {population_path}")
+    print("Datos de población cargados")
 
     # --------------------------------------------------------------------------
     # 3. Calcular proporción poblacional (ratio)
@@ -184,12 +185,8 @@ def project_subnational_gdp_share(
     df_final = df_final.div(df_final.sum(axis=1), axis=0) * 100
 
     # --------------------------------------------------------------------------
-    # 10. Guardar resultados (CSV) y metadata
+    # 10. Guardar resultados con metadata embebida
     # --------------------------------------------------------------------------
-    ensure_dir(os.path.dirname(output_path))
-    df_final.T.to_csv(output_path)
-    print(f"\nProyecciones guardadas en: {output_path}")
-
     metadata = {
         'dataset': {
             'name': 'Proyección de participación (panel FE + reinsertar datos reales)',
@@ -215,10 +212,9 @@ def project_subnational_gdp_share(
         }
     }
 
-    metadata_path = os.path.join(os.path.dirname(output_path), 'metadata.yaml')
-    with open(metadata_path, 'w', encoding='utf-8') as f:
-        yaml.dump(metadata, f, allow_unicode=True, sort_keys=False)
-    print(f"Metadata guardada en: {metadata_path}")
+    # Departamentos por fila, igual que el CSV histórico
+    save_with_metadata(df_final.T.reset_index(), output_path, metadata)
+    print(f"\nProyecciones guardadas en: {output_path}")
 
     return df_final, metadata
 
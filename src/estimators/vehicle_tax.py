@@ -1,14 +1,10 @@
 """
 Estimación de datos faltantes usando control sintético
 """
-from ..utils.io import ensure_dir, read_file
+from ..utils.io import load_input, save_with_metadata
 from ..utils.validations import validate_non_empty
 import pandas as pd
 import numpy as np
-from sklearn.linear_model import ElasticNetCV
-from sklearn.model_selection import TimeSeriesSplit
-import os
-import yaml
 
 def estimate_missing_vehicle_tax(
     input_path,
@@ -26,10 +22,11 @@ def estimate_missing_vehicle_tax(
     
     Parámetros
     ----------
-    input_path : str
-        CSV con datos de recaudación [departamento, año, recaudacion]
-    population_path : str
-        CSV con población por departamento
+    input_path : str o pd.DataFrame
+        CSV (o DataFrame en memoria) con datos de recaudación
+        [departamento, año, recaudacion]
+    population_path : str o pd.DataFrame
+        CSV (o DataFrame en memoria) con población por departamento
     output_path : str
         Ruta para guardar resultados
     years_params : dict
@@ -39,11 +36,16 @@ def estimate_missing_vehicle_tax(
     treatment_year : int
         Año de corte para entrenamiento (default: 2007)
     """
+    # Import diferido: scikit-learn es pesado y solo lo usa esta etapa
+    from sklearn.linear_model import ElasticNetCV
+    from sklearn.model_selection import TimeSeriesSplit
+
     print(f"\nEstimando control sintético para {target_dept}...")
     
     # 1. Cargar y validar datos
-    df = read_file(input_path)
-    df_pop = read_file(population_path)
+    df = load_input(input_path)
+    df.columns = df.columns.map(str)
+    df_pop = load_input(population_path)
     
     validate_non_empty(df, "Recaudación")
     validate_non_empty(df_pop, "Población")
@@ -114,8 +116,6 @@ def estimate_missing_vehicle_tax(
     )
     
     # 5. Guardar solo las predicciones
-    ensure_dir(os.path.dirname(output_path))
-    
     # Crear DataFrame con formato original pero solo con predicciones
     df_estimated = pd.DataFrame({'DEPARTAMENTO': [target_dept]})
     
@@ -128,9 +128,6 @@ def estimate_missing_vehicle_tax(
     for year, value in zip(years_estimated, predictions.values):
         df_estimated[year] = value
     
-    # Guardar solo estimaciones
-    df_estimated.to_csv(output_path, index=False)
-    
     # Metadata específica para estimaciones
     metadata = {
         'dataset': {
@@ -156,9 +153,7 @@ def estimate_missing_vehicle_tax(
         }
     }
     
-    # Guardar metadata
-    metadata_path = os.path.join(os.path.dirname(output_path), 'metadata.yaml')
-    with open(metadata_path, 'w', encoding='utf-8') as f:
-        yaml.dump(metadata, f, allow_unicode=True, sort_keys=False)
+    # Guardar solo estimaciones con metadata embebida
+    save_with_metadata(df_estimated, output_path, metadata)
     
     return df_estimated, metadata
\ No newline at end of file
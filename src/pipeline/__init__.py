@@ -0,0 +1,14 @@
+from .scheduler import Ref, Stage, load_callable, resolve_dependencies, run_pipeline, select_stages
+from .cache import StageCache
+from .profiling import StageProfiler
+
+__all__ = [
+    'Ref',
+    'Stage',
+    'StageCache',
+    'StageProfiler',
+    'load_callable',
+    'resolve_dependencies',
+    'run_pipeline',
+    'select_stages'
+]
@@ -0,0 +1,361 @@
+"""
+Cache incremental de etapas basado en hashes de contenido
+"""
+from typing import Any, Dict, Iterator, Optional
+from omegaconf import DictConfig, ListConfig, OmegaConf
+from .scheduler import Ref, Stage, StaleReservation, source_file
+from contextlib import contextmanager, suppress
+import ast
+import glob
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import time
+
+def _to_plain(value: Any) -> Any:
+    """Convierte configuraciones de OmegaConf a tipos nativos"""
+    if isinstance(value, (DictConfig, ListConfig)):
+        return OmegaConf.to_container(value, resolve=True)
+    return value
+
+def _materialized(path: str) -> str:
+    """Ruta en disco de una salida: el CSV declarado o su artefacto Parquet"""
+    if os.path.exists(path):
+        return path
+    artifact = os.path.splitext(path)[0] + '.parquet'
+    return artifact if os.path.exists(artifact) else path
+
+def _module_path(base_dir: str, name: str) -> Optional[str]:
+    """Archivo fuente de un módulo bajo `base_dir`, si existe"""
+    path = os.path.join(base_dir, *name.split('.'))
+    for candidate in (path + '.py', os.path.join(path, '__init__.py')):
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+def _imported_names(tree: ast.AST, name: str, is_package: bool) -> Iterator[str]:
+    """Nombres absolutos de los módulos (o atributos) importados en un árbol"""
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            yield from (alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            module = node.module or ''
+            if node.level:
+                parts = name.split('.')
+                parts = parts[:len(parts) - node.level + is_package]
+                module = '.'.join(parts + ([node.module] if node.module else []))
+            yield module
+            # `from paquete import modulo` también importa el submódulo
+            yield from (f"{module}.{alias.name}" for alias in node.names)
+
+def local_sources(module_name: str, origin: str) -> Dict[str, str]:
+    """
+    Archivos fuente de un módulo y de todos los módulos de su mismo
+    paquete que importa, directa o transitivamente. Se analiza el código
+    sin importarlo, para no cargar dependencias pesadas.
+
+    Returns:
+        {nombre del módulo: archivo fuente}
+    """
+    parts = module_name.split('.')
+    base_dir = origin
+    for _ in range(len(parts) + (os.path.basename(origin) == '__init__.py')):
+        base_dir = os.path.dirname(base_dir)
+    package = parts[0]
+
+    sources = {}
+    pending = [(module_name, origin)]
+    while pending:
+        name, path = pending.pop()
+        if name in sources:
+            continue
+        sources[name] = path
+        with open(path, 'rb') as f:
+            tree = ast.parse(f.read(), path)
+        is_package = os.path.basename(path) == '__init__.py'
+        for imported in _imported_names(tree, name, is_package):
+            if imported != package and not imported.startswith(package + '.'):
+                continue
+            imported_path = _module_path(base_dir, imported)
+            if imported_path is not None:
+                pending.append((imported, imported_path))
+    return sources
+
+
+class StageCache:
+    """
+    Manifiesto de claves por etapa. La clave combina el hash de los
+    archivos de entrada, los parámetros de la etapa, la versión del
+    código y las claves de las etapas previas. Si la clave coincide
+    con la guardada la etapa se omite y se reutiliza su resultado.
+
+    Args:
+        cache_dir: Directorio del manifiesto y los resultados
+        reuse_variants: Si conservar varias variantes por etapa
+            (barridos donde varios trabajos comparten el cache). Una
+            variante se reutiliza si la etapa no declara salidas o si
+            sus salidas en disco fueron escritas con esa misma clave
+        max_variants: Variantes por etapa a conservar con `reuse_variants`
+    """
+
+    def __init__(self, cache_dir: str, reuse_variants: bool = False, max_variants: int = 8):
+        self.cache_dir = cache_dir
+        self.reuse_variants = reuse_variants
+        self.max_variants = max_variants
+        self.results_dir = os.path.join(cache_dir, 'results')
+        self.manifest_path = os.path.join(cache_dir, 'manifest.json')
+        os.makedirs(self.results_dir, exist_ok=True)
+
+        self.manifest = self._read_manifest()
+        self._stored: Dict[str, Dict[str, Any]] = {}  # etapas guardadas por este proceso
+
+    def _read_manifest(self) -> Dict[str, Any]:
+        """Manifiesto en disco (lo comparten los trabajos de un barrido)"""
+        if not os.path.exists(self.manifest_path):
+            return {'stages': {}, 'files': {}}
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def file_hash(self, path: str) -> str:
+        """Hash de un archivo (reutilizado si mtime y tamaño no cambian)"""
+        stat = os.stat(path)
+        entry = self.manifest['files'].get(path)
+        if entry and entry['mtime'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+            return entry['sha256']
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        sha = digest.hexdigest()
+        self.manifest['files'][path] = {
+            'mtime': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'sha256': sha
+        }
+        return sha
+
+    def path_hash(self, path: str) -> str:
+        """Hash de un archivo o de todos los archivos de un directorio"""
+        if not os.path.isdir(path):
+            return self.file_hash(_materialized(path))
+        digest = hashlib.sha256()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                digest.update(os.path.relpath(file_path, path).encode())
+                digest.update(self.file_hash(file_path).encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def code_version(stage: Stage) -> str:
+        """
+        Hash del código fuente del módulo que implementa la etapa y de los
+        módulos del paquete que importa (utilidades compartidas incluidas)
+        """
+        if callable(stage.func):
+            module_name = inspect.unwrap(stage.func).__module__
+        else:
+            module_name = stage.func.partition(':')[0]
+        digest = hashlib.sha256()
+        for name, path in sorted(local_sources(module_name, source_file(stage.func)).items()):
+            digest.update(name.encode())
+            with open(path, 'rb') as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+        return digest.hexdigest()
+
+    def key(self, stage: Stage, produced: Dict[str, str], upstream_keys: Dict[str, str]) -> str:
+        """
+        Calcula la clave de una etapa.
+
+        Args:
+            stage: Etapa a evaluar
+            produced: {salida: etapa que la produce} para entradas intermedias
+            upstream_keys: Claves de las etapas de las que depende
+        """
+        inputs = {}
+        for path in stage.inputs:
+            if path in produced:
+                inputs[path] = upstream_keys[produced[path]]
+            else:
+                inputs[path] = self.path_hash(path)
+
+        if stage.params is not None:
+            params = _to_plain(stage.params)
+        else:
+            params = {
+                'args': [_to_plain(a) for a in stage.args if not isinstance(a, Ref)],
+                'kwargs': {
+                    k: _to_plain(v) for k, v in stage.kwargs.items()
+                    if not isinstance(v, Ref)
+                }
+            }
+
+        payload = {
+            'stage': stage.name,
+            'code': self.code_version(stage),
+            'inputs': inputs,
+            'outputs': list(stage.outputs),
+            'params': params,
+            'upstream': dict(sorted(upstream_keys.items()))
+        }
+        encoded = json.dumps(payload, sort_keys=True, default=str).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    def _result_path(self, name: str, key: str) -> str:
+        return os.path.join(self.results_dir, f"{name}-{key[:16]}.pkl")
+
+    def _lock_path(self, name: str, key: str) -> str:
+        return os.path.join(self.results_dir, f"{name}-{key[:16]}.lock")
+
+    def lookup(self, stage: Stage, key: str):
+        """
+        Devuelve (hit, resultado) para la etapa y clave dadas. Si la etapa
+        declara salidas solo hay acierto cuando, según el manifiesto en
+        disco, los archivos fueron escritos por esta misma clave; de lo
+        contrario las etapas siguientes leerían datos de otra variante.
+        """
+        result_path = self._result_path(stage.name, key)
+        if not os.path.exists(result_path):
+            return False, None
+        entry = self._read_manifest()['stages'].get(stage.name)
+        written = entry is not None and entry['key'] == key
+        if stage.outputs:
+            if not (written and all(os.path.exists(_materialized(p)) for p in stage.outputs)):
+                return False, None
+        elif not (written or self.reuse_variants):
+            return False, None
+        with open(result_path, 'rb') as f:
+            return True, pickle.load(f)
+
+    def acquire(self, name: str, key: str) -> bool:
+        """
+        Reserva el cálculo de (etapa, clave) entre procesos. Devuelve False
+        si otro proceso ya lo está calculando.
+        """
+        return self._try_lock(self._lock_path(name, key))
+
+    def _try_lock(self, lock_path: str) -> bool:
+        """Crea el archivo de reserva con el pid (descarta reservas huérfanas)"""
+        if self._is_stale(lock_path):
+            with suppress(FileNotFoundError):
+                os.remove(lock_path)
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            f.write(str(os.getpid()))
+        return True
+
+    @contextmanager
+    def _manifest_lock(self, timeout_s: float = 60.0, poll_s: float = 0.05):
+        """Exclusión entre procesos para leer, combinar y escribir el manifiesto"""
+        lock_path = f"{self.manifest_path}.lock"
+        deadline = time.monotonic() + timeout_s
+        while not self._try_lock(lock_path):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"No se pudo bloquear el manifiesto {self.manifest_path}")
+            time.sleep(poll_s)
+        try:
+            yield
+        finally:
+            with suppress(FileNotFoundError):
+                os.remove(lock_path)
+
+    @staticmethod
+    def _is_stale(lock_path: str) -> bool:
+        """Reserva de un proceso que ya no existe (p. ej. una corrida abortada)"""
+        try:
+            with open(lock_path, 'r') as f:
+                pid = int(f.read() or 0)
+        except (FileNotFoundError, ValueError):
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            return False
+        return False
+
+    def release(self, name: str, key: str):
+        """Libera la reserva de (etapa, clave)"""
+        lock_path = self._lock_path(name, key)
+        if os.path.exists(lock_path):
+            os.remove(lock_path)
+
+    def wait_for(self, name: str, key: str, poll_s: float = 0.5, timeout_s: float = 3600.0) -> Any:
+        """
+        Espera el resultado que está calculando otro proceso.
+
+        Raises:
+            StaleReservation: Si el proceso dueño de la reserva murió (el
+                llamador puede tomar la reserva y calcular la etapa)
+            TimeoutError: Si el resultado no aparece en `timeout_s`
+        """
+        result_path = self._result_path(name, key)
+        lock_path = self._lock_path(name, key)
+        deadline = time.monotonic() + timeout_s
+        while not os.path.exists(result_path):
+            if not os.path.exists(lock_path):
+                raise RuntimeError(
+                    f"La etapa {name} terminó en otro proceso sin guardar resultado"
+                )
+            if self._is_stale(lock_path):
+                raise StaleReservation(name)
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"La etapa {name} no terminó en otro proceso en {timeout_s:.0f}s")
+            time.sleep(poll_s)
+        with open(result_path, 'rb') as f:
+            return pickle.load(f)
+
+    def store(self, stage: Stage, key: str, result: Any):
+        """
+        Guarda el resultado de la etapa y actualiza el manifiesto. Debe
+        llamarse cuando sus salidas ya están en disco: la entrada del
+        manifiesto certifica que los archivos son de esta clave.
+        """
+        result_path = self._result_path(stage.name, key)
+        tmp_path = f"{result_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, result_path)
+
+        self._prune(stage.name, keep=result_path)
+        entry = {'key': key, 'outputs': list(stage.outputs)}
+        self.manifest['stages'][stage.name] = entry
+        self._stored[stage.name] = entry
+        self.save()
+
+    def _prune(self, name: str, keep: str):
+        """Conserva como máximo `max_variants` resultados por etapa"""
+        max_variants = self.max_variants if self.reuse_variants else 1
+        variants = sorted(
+            glob.glob(os.path.join(self.results_dir, f"{glob.escape(name)}-*.pkl")),
+            key=os.path.getmtime,
+            reverse=True
+        )
+        variants = [keep] + [v for v in variants if v != keep]
+        for path in variants[max_variants:]:
+            with suppress(FileNotFoundError):
+                os.remove(path)
+
+    def save(self):
+        """
+        Combina el manifiesto en disco con las etapas guardadas por este
+        proceso y lo escribe de forma atómica, sin pisar las entradas que
+        escribieron otros trabajos del barrido.
+        """
+        with self._manifest_lock():
+            manifest = self._read_manifest()
+            manifest['files'].update(self.manifest['files'])
+            manifest['stages'].update(self._stored)
+            tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.manifest_path)
+        self.manifest = manifest
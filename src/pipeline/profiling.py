@@ -0,0 +1,256 @@
+"""
+Perfilado de etapas del pipeline (tiempos, memoria, tamaños y E/S)
+"""
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+import cProfile
+import csv
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+REPORT_FIELDS = [
+    'run_id', 'stage', 'status', 'wall_s', 'cpu_s', 'peak_memory_mb',
+    'rows_in', 'cols_in', 'rows_out', 'cols_out', 'bytes_read', 'bytes_written'
+]
+
+
+def measure(
+    func: Callable[..., Any],
+    args: tuple,
+    kwargs: Dict[str, Any],
+    memory: bool = False,
+    tool: Optional[str] = None,
+    profile_path: Optional[str] = None,
+    cpu_clock: str = 'thread'
+):
+    """
+    Ejecuta `func` midiendo tiempo de pared, tiempo de CPU y pico de
+    memoria. Opcionalmente guarda un perfil cProfile o pyinstrument.
+
+    Args:
+        memory: Si medir el pico de memoria con tracemalloc (se detiene
+            al terminar si no estaba activo antes)
+        tool: None, 'cprofile' o 'pyinstrument'
+        profile_path: Ruta (sin extensión) para el perfil
+        cpu_clock: 'thread' (thread_time) o 'process' (process_time)
+
+    Returns:
+        (resultado, métricas)
+    """
+    clock = time.thread_time if cpu_clock == 'thread' else time.process_time
+
+    started_tracing = False
+    if memory:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracing = True
+        tracemalloc.reset_peak()
+        base_memory = tracemalloc.get_traced_memory()[0]
+
+    profiler = None
+    if tool == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif tool == 'pyinstrument':
+        from pyinstrument import Profiler
+        profiler = Profiler()
+        profiler.start()
+
+    wall_start, cpu_start = time.perf_counter(), clock()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        metrics = {
+            'wall_s': time.perf_counter() - wall_start,
+            'cpu_s': clock() - cpu_start,
+            'peak_memory_mb': None
+        }
+        if memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            metrics['peak_memory_mb'] = max(peak - base_memory, 0) / 1024 ** 2
+            if started_tracing:
+                tracemalloc.stop()
+
+        if tool == 'cprofile':
+            profiler.disable()
+            profiler.dump_stats(f"{profile_path}.prof")
+        elif tool == 'pyinstrument':
+            profiler.stop()
+            with open(f"{profile_path}.html", 'w', encoding='utf-8') as f:
+                f.write(profiler.output_html())
+
+    return result, metrics
+
+
+def _shape(obj: Any):
+    """(filas, columnas) del primer DataFrame/Series encontrado"""
+    if isinstance(obj, (tuple, list)):
+        for item in obj:
+            shape = _shape(item)
+            if shape != (0, 0):
+                return shape
+        return 0, 0
+    shape = getattr(obj, 'shape', None)
+    if shape is None or not hasattr(obj, 'index'):
+        return 0, 0
+    return shape[0], shape[1] if len(shape) > 1 else 1
+
+
+def _size(path: str) -> int:
+    """Tamaño en bytes de un archivo o directorio"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total
+
+
+class StageProfiler:
+    """
+    Registra métricas por etapa y escribe un reporte JSON/CSV.
+
+    La memoria se mide con tracemalloc, que es global al proceso y
+    agrega una sobrecarga considerable: solo se mide con executor
+    'process' o con max_workers=1. Con etapas simultáneas en hilos los
+    `reset_peak` de una etapa corromperían los picos de las demás, así
+    que en ese caso la medición se desactiva.
+
+    Por lo mismo, desde Python 3.12 cProfile registra una herramienta
+    `sys.monitoring` global y un segundo perfil simultáneo falla; con
+    etapas en hilos concurrentes se usa solo con max_workers=1.
+
+    `bytes_read` y `bytes_written` son el tamaño en disco de las entradas
+    (que no llegan en memoria) y salidas declaradas de la etapa; no miden
+    la E/S real.
+
+    Args:
+        output_dir: Directorio del reporte (el de salida de Hydra)
+        memory: Si medir el pico de memoria
+        tool: None, 'cprofile' o 'pyinstrument'
+        executor: Executor del pipeline ('thread' o 'process')
+        history_path: CSV acumulado para comparar corridas en el tiempo
+        max_workers: Etapas simultáneas del pipeline
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        memory: bool = False,
+        tool: Optional[str] = None,
+        executor: str = 'thread',
+        history_path: Optional[str] = None,
+        max_workers: Optional[int] = None
+    ):
+        if tool not in (None, 'cprofile', 'pyinstrument'):
+            raise ValueError(f"Herramienta de perfilado no soportada: {tool}")
+        if memory and executor == 'thread' and max_workers != 1:
+            print("Medición de memoria desactivada: requiere executor 'process' o max_workers=1")
+            memory = False
+        if (tool == 'cprofile' and executor == 'thread' and max_workers != 1
+                and sys.version_info >= (3, 12)):
+            print("Perfil cProfile desactivado: con Python 3.12+ requiere executor 'process' o max_workers=1")
+            tool = None
+        self.output_dir = output_dir
+        self.memory = memory
+        self.tool = tool
+        self.executor = executor
+        self.history_path = history_path
+        self.run_id = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+        self.records: List[Dict[str, Any]] = []
+        self.total_wall_s: Optional[float] = None
+        self._outputs: Dict[str, List[str]] = {}
+
+    def options(self, name: str) -> Dict[str, Any]:
+        """Argumentos para `measure` en la etapa dada"""
+        profile_path = None
+        if self.tool:
+            profile_dir = os.path.join(self.output_dir, 'profiles')
+            os.makedirs(profile_dir, exist_ok=True)
+            profile_path = os.path.join(profile_dir, name)
+        return {
+            'memory': self.memory,
+            'tool': self.tool,
+            'profile_path': profile_path,
+            'cpu_clock': self.executor
+        }
+
+    def record(
+        self,
+        stage,
+        args: Iterable[Any],
+        result: Any,
+        metrics: Optional[Dict[str, Any]],
+        produced: Iterable[str] = ()
+    ):
+        """Registra una etapa ejecutada (o reutilizada si `metrics` es None)"""
+        rows_in = cols_in = 0
+        for arg in args:
+            rows, cols = _shape(arg)
+            rows_in += rows
+            cols_in += cols
+        rows_out, cols_out = _shape(result)
+
+        # Solo cuentan como leídos los archivos que no llegan en memoria
+        bytes_read = sum(
+            _size(p) for p in stage.inputs
+            if p not in produced and os.path.exists(p)
+        )
+
+        self._outputs[stage.name] = list(stage.outputs)
+        self.records.append({
+            'run_id': self.run_id,
+            'stage': stage.name,
+            'status': 'run' if metrics is not None else 'cached',
+            **(metrics or {'wall_s': 0.0, 'cpu_s': 0.0, 'peak_memory_mb': None}),
+            'rows_in': rows_in,
+            'cols_in': cols_in,
+            'rows_out': rows_out,
+            'cols_out': cols_out,
+            'bytes_read': bytes_read if metrics is not None else 0,
+            'bytes_written': None
+        })
+
+    def write_report(self):
+        """
+        Escribe profile.json y profile.csv en `output_dir`. Debe llamarse
+        después de que terminen las escrituras en segundo plano para que
+        `bytes_written` refleje los archivos finales.
+        """
+        for record in self.records:
+            if record['status'] == 'run':
+                record['bytes_written'] = sum(
+                    _size(p) for p in self._outputs[record['stage']] if os.path.exists(p)
+                )
+            else:
+                record['bytes_written'] = 0
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        json_path = os.path.join(self.output_dir, 'profile.json')
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'run_id': self.run_id,
+                'executor': self.executor,
+                'total_wall_s': self.total_wall_s,
+                'stages': self.records
+            }, f, indent=2)
+
+        csv_path = os.path.join(self.output_dir, 'profile.csv')
+        self._write_csv(csv_path, append=False)
+        if self.history_path:
+            self._write_csv(self.history_path, append=True)
+
+        print(f"Reporte de perfilado guardado en: {json_path}")
+        return json_path, csv_path
+
+    def _write_csv(self, path: str, append: bool):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        write_header = not (append and os.path.exists(path))
+        with open(path, 'a' if append else 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+            if write_header:
+                writer.writeheader()
+            writer.writerows(self.records)
@@ -0,0 +1,391 @@
+"""
+Planificador de etapas del pipeline como grafo dirigido acíclico (DAG)
+"""
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait
+)
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+import importlib
+import importlib.util
+import inspect
+import time
+
+from .profiling import measure
+from ..utils.io import collect_writes
+
+if TYPE_CHECKING:
+    from .cache import StageCache
+    from .profiling import StageProfiler
+
+
+class StaleReservation(RuntimeError):
+    """La reserva de una etapa pertenece a un proceso que ya no existe"""
+
+    def __init__(self, stage: str):
+        super().__init__(f"El proceso que calculaba la etapa {stage} terminó sin liberarla")
+        self.stage = stage
+
+
+@dataclass(frozen=True)
+class Ref:
+    """Referencia al resultado en memoria de otra etapa.
+
+    Si `index` está definido se toma ese elemento del resultado
+    (útil para funciones que devuelven tuplas).
+    """
+    stage: str
+    index: Optional[int] = None
+
+
+@dataclass
+class Stage:
+    """
+    Nodo del pipeline con entradas y salidas explícitas.
+
+    Args:
+        name: Nombre único de la etapa
+        func: Función a ejecutar, o su ubicación 'modulo:funcion' para
+            importarla recién al ejecutar la etapa
+        args: Argumentos posicionales (pueden contener `Ref`)
+        kwargs: Argumentos nombrados (pueden contener `Ref`)
+        inputs: Archivos o directorios que lee la etapa
+        outputs: Archivos o directorios que escribe la etapa
+        after: Etapas adicionales de las que depende
+        params: Parámetros relevantes para el cache (por defecto,
+            los argumentos que no son `Ref`)
+    """
+    name: str
+    func: Union[str, Callable[..., Any]]
+    args: Tuple[Any, ...] = ()
+    kwargs: Dict[str, Any] = field(default_factory=dict)
+    inputs: List[str] = field(default_factory=list)
+    outputs: List[str] = field(default_factory=list)
+    after: List[str] = field(default_factory=list)
+    params: Optional[Dict[str, Any]] = None
+
+    def refs(self) -> List[Ref]:
+        """Referencias a otras etapas usadas en los argumentos"""
+        values = list(self.args) + list(self.kwargs.values())
+        return [v for v in values if isinstance(v, Ref)]
+
+
+def load_callable(func: Union[str, Callable[..., Any]]) -> Callable[..., Any]:
+    """Importa una función declarada como 'modulo:funcion'"""
+    if callable(func):
+        return func
+    module_name, _, attr = func.partition(':')
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def source_file(func: Union[str, Callable[..., Any]]) -> str:
+    """Archivo fuente de la función sin necesidad de importarla"""
+    if callable(func):
+        return inspect.getsourcefile(inspect.unwrap(func))
+    module_name = func.partition(':')[0]
+    return importlib.util.find_spec(module_name).origin
+
+
+def select_stages(stages: List[Stage], names: Optional[Iterable[str]] = None) -> List[Stage]:
+    """
+    Devuelve las etapas pedidas junto con todas las etapas previas de
+    las que dependen (en el orden de declaración). Con `names=None`
+    devuelve todas.
+    """
+    if names is None:
+        return list(stages)
+
+    deps = resolve_dependencies(stages)
+    unknown = set(names) - set(deps)
+    if unknown:
+        raise ValueError(f"Etapas inexistentes: {sorted(unknown)}")
+
+    selected = set()
+    to_visit = list(names)
+    while to_visit:
+        name = to_visit.pop()
+        if name not in selected:
+            selected.add(name)
+            to_visit.extend(deps[name])
+    return [s for s in stages if s.name in selected]
+
+
+def resolve_dependencies(stages: List[Stage]) -> Dict[str, Set[str]]:
+    """
+    Calcula las dependencias de cada etapa a partir de sus entradas,
+    salidas, referencias y dependencias explícitas.
+    """
+    names = [s.name for s in stages]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Nombres de etapa duplicados: {names}")
+
+    producers = {}
+    for stage in stages:
+        for output in stage.outputs:
+            if output in producers:
+                raise ValueError(
+                    f"La salida {output} es producida por "
+                    f"{producers[output]} y {stage.name}"
+                )
+            producers[output] = stage.name
+
+    deps = {}
+    for stage in stages:
+        stage_deps = set(stage.after)
+        stage_deps.update(producers[p] for p in stage.inputs if p in producers)
+        stage_deps.update(ref.stage for ref in stage.refs())
+        stage_deps.discard(stage.name)
+
+        unknown = stage_deps - set(names)
+        if unknown:
+            raise ValueError(f"Etapa {stage.name} depende de etapas inexistentes: {unknown}")
+        deps[stage.name] = stage_deps
+
+    _check_acyclic(deps)
+    return deps
+
+
+def _check_acyclic(deps: Dict[str, Set[str]]):
+    """Valida que el grafo no tenga ciclos (algoritmo de Kahn)"""
+    remaining = {name: set(d) for name, d in deps.items()}
+    while remaining:
+        ready = [name for name, d in remaining.items() if not d]
+        if not ready:
+            raise ValueError(f"Ciclo de dependencias entre etapas: {sorted(remaining)}")
+        for name in ready:
+            del remaining[name]
+        for d in remaining.values():
+            d.difference_update(ready)
+
+
+def _resolve(value: Any, results: Dict[str, Any]) -> Any:
+    """Reemplaza una `Ref` por el resultado correspondiente"""
+    if not isinstance(value, Ref):
+        return value
+    result = results[value.stage]
+    return result if value.index is None else result[value.index]
+
+
+def _call(
+    func: Union[str, Callable[..., Any]],
+    args: Tuple[Any, ...],
+    kwargs: Dict[str, Any],
+    profile_options: Optional[Dict[str, Any]] = None
+) -> Any:
+    func = load_callable(func)
+    if profile_options is None:
+        return func(*args, **kwargs)
+    return measure(func, args, kwargs, **profile_options)
+
+
+def _call_stage(
+    func: Union[str, Callable[..., Any]],
+    args: Tuple[Any, ...],
+    kwargs: Dict[str, Any],
+    profile_options: Optional[Dict[str, Any]] = None
+) -> Tuple[Any, List[Any]]:
+    """Ejecuta una etapa; devuelve (resultado, escrituras en segundo plano que lanzó)"""
+    with collect_writes() as writes:
+        result = _call(func, args, kwargs, profile_options)
+    return result, writes
+
+
+class _PipelineRun:
+    """Estado de una corrida: etapas en curso, resultados y reservas del cache"""
+
+    def __init__(
+        self,
+        stages: List[Stage],
+        cache: Optional['StageCache'],
+        profiler: Optional['StageProfiler']
+    ):
+        self.deps = resolve_dependencies(stages)
+        self.by_name = {s.name: s for s in stages}
+        self.pending = [s.name for s in stages]
+        self.produced = {out: s.name for s in stages for out in s.outputs}
+        self.cache = cache
+        self.profiler = profiler
+        self.results: Dict[str, Any] = {}
+        self.keys: Dict[str, str] = {}
+        self.running: Dict[Any, str] = {}
+        self.started: Dict[str, float] = {}
+        self.stage_args: Dict[str, Tuple[Any, ...]] = {}
+        self.owned: Set[str] = set()    # etapas reservadas en el cache por este proceso
+        self.waiting: Set[str] = set()  # etapas que calcula otro proceso
+        self.unstored: Dict[str, List[Any]] = {}  # etapas con escrituras en curso
+
+    def ready(self) -> List[str]:
+        """Etapas pendientes cuyas dependencias ya terminaron"""
+        return [name for name in self.pending if self.deps[name].issubset(self.results)]
+
+    def _from_cache(self, pool, name: str) -> bool:
+        """
+        Resuelve la etapa desde el cache o espera a otro proceso que ya la
+        calcula. Devuelve False si hay que ejecutarla (queda reservada).
+        """
+        stage = self.by_name[name]
+        self.keys[name] = self.cache.key(
+            stage, self.produced, {d: self.keys[d] for d in self.deps[name]}
+        )
+        hit, cached = self.cache.lookup(stage, self.keys[name])
+        if hit:
+            print(f"↷ Etapa {name} sin cambios, se reutiliza el resultado")
+            self.results[name] = cached
+            if self.profiler is not None:
+                self.profiler.record(stage, [], cached, None)
+            return True
+
+        if not self.cache.acquire(name, self.keys[name]):
+            # Otro trabajo del barrido ya calcula esta misma etapa
+            print(f"… Etapa {name} en curso en otro proceso, esperando su resultado")
+            self._wait(pool, name)
+            return True
+        self.owned.add(name)
+        return False
+
+    def _wait(self, pool, name: str):
+        self.started[name] = time.perf_counter()
+        self.waiting.add(name)
+        future = pool.submit(_call, self.cache.wait_for, (name, self.keys[name]), {})
+        self.running[future] = name
+
+    def _take_over(self, pool, name: str):
+        """Calcula aquí una etapa cuyo proceso dueño murió sin liberarla"""
+        self.waiting.discard(name)
+        if not self.cache.acquire(name, self.keys[name]):
+            # Otro proceso la tomó primero
+            self._wait(pool, name)
+            return
+        print(f"↻ Etapa {name} abandonada por otro proceso, se calcula aquí")
+        self.owned.add(name)
+        self._launch(pool, name)
+
+    def submit(self, pool, name: str):
+        """Lanza una etapa lista (o la resuelve desde el cache)"""
+        self.pending.remove(name)
+        if self.cache is not None and self._from_cache(pool, name):
+            return
+        self._launch(pool, name)
+
+    def _launch(self, pool, name: str):
+        stage = self.by_name[name]
+        args = tuple(_resolve(a, self.results) for a in stage.args)
+        kwargs = {k: _resolve(v, self.results) for k, v in stage.kwargs.items()}
+        print(f"▶ Iniciando etapa {name}...")
+        self.started[name] = time.perf_counter()
+        options = self.profiler.options(name) if self.profiler is not None else None
+        self.stage_args[name] = args + tuple(kwargs.values())
+        self.running[pool.submit(_call_stage, stage.func, args, kwargs, options)] = name
+
+    def complete(self, pool, future):
+        """Registra el resultado de una etapa terminada"""
+        name = self.running.pop(future)
+        try:
+            result = future.result()
+        except StaleReservation:
+            self._take_over(pool, name)
+            return
+        except Exception as e:
+            for other in self.running:
+                other.cancel()
+            raise RuntimeError(f"Falló la etapa {name}: {e}") from e
+
+        writes = []
+        if name not in self.waiting:
+            result, writes = result
+        if self.profiler is not None:
+            if name in self.waiting:
+                self.profiler.record(self.by_name[name], [], result, None)
+            else:
+                result, metrics = result
+                self.profiler.record(
+                    self.by_name[name], self.stage_args.pop(name), result,
+                    metrics, self.produced
+                )
+        self.results[name] = result
+
+        # Se guarda en el cache recién cuando sus salidas están en disco
+        if name in self.owned:
+            self.unstored[name] = writes
+        duration = time.perf_counter() - self.started[name]
+        print(f"✓ Etapa {name} completada en {duration:.2f}s")
+
+    def pending_writes(self) -> List[Any]:
+        """Escrituras en curso de etapas aún no guardadas en el cache"""
+        return [w for writes in self.unstored.values() for w in writes if not w.done()]
+
+    def store_written(self):
+        """Guarda en el cache las etapas cuyas escrituras terminaron"""
+        for name, writes in list(self.unstored.items()):
+            if not all(w.done() for w in writes):
+                continue
+            del self.unstored[name]
+            for write in writes:
+                try:
+                    write.result()
+                except Exception as e:
+                    raise RuntimeError(f"Falló la escritura de la etapa {name}: {e}") from e
+            self.cache.store(self.by_name[name], self.keys[name], self.results[name])
+            self.cache.release(name, self.keys[name])
+            self.owned.discard(name)
+
+    def release_all(self):
+        """Libera las reservas pendientes (p. ej. si falló una etapa)"""
+        for name in self.owned:
+            self.cache.release(name, self.keys[name])
+
+
+def run_pipeline(
+    stages: List[Stage],
+    max_workers: Optional[int] = None,
+    executor: str = 'thread',
+    cache: Optional['StageCache'] = None,
+    profiler: Optional['StageProfiler'] = None
+) -> Dict[str, Any]:
+    """
+    Ejecuta las etapas respetando sus dependencias. Las etapas
+    independientes corren en paralelo, de modo que el tiempo total
+    es el del camino crítico y no la suma de todas las etapas.
+
+    Args:
+        stages: Etapas a ejecutar
+        max_workers: Cantidad máxima de etapas simultáneas
+        executor: 'thread' o 'process'
+        cache: Cache incremental; las etapas cuya clave no cambió
+            se omiten y reutilizan su resultado anterior
+        profiler: Registra tiempos, memoria, tamaños y E/S por etapa
+
+    Returns:
+        Diccionario {nombre de etapa: resultado}
+    """
+    if executor not in ('thread', 'process'):
+        raise ValueError(f"Executor no soportado: {executor}")
+
+    run = _PipelineRun(stages, cache, profiler)
+    pool_cls = ThreadPoolExecutor if executor == 'thread' else ProcessPoolExecutor
+
+    start_time = time.perf_counter()
+    try:
+        with pool_cls(max_workers=max_workers) as pool:
+            while run.pending or run.running or run.unstored:
+                for name in run.ready():
+                    run.submit(pool, name)
+                run.store_written()
+                waiting_on = list(run.running) + run.pending_writes()
+                if not waiting_on:
+                    continue
+                finished, _ = wait(waiting_on, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    if future in run.running:
+                        run.complete(pool, future)
+    finally:
+        run.release_all()
+
+    total = time.perf_counter() - start_time
+    if profiler is not None:
+        profiler.total_wall_s = total
+    print(f"Pipeline completado en {total:.2f}s")
+    return run.results
@@ -2,124 +2,376 @@
 Orquestador principal actualizado
 """
 import hydra
+from hydra.core.hydra_config import HydraConfig
 from omegaconf import DictConfig
-from src.processors import economic, prices, taxes, fuels, geo, exchange_rates
-from src.estimators import population as pop_estimator
+from src.pipeline import Ref, Stage, StageCache, StageProfiler, run_pipeline, select_stages
 import os
 
+def build_stages(cfg: DictConfig):
+    """
+    Declara las etapas del pipeline con sus entradas y salidas.
+
+    Las funciones se referencian como 'modulo:funcion' para que solo se
+    importen (junto con geopandas, statsmodels, etc.) las etapas que
+    efectivamente se ejecutan.
+    """
+    def raw(path):
+        return os.path.join(cfg.data.raw.base_dir, path)
+
+    def processed(path):
+        return os.path.join(cfg.data.processed.base_dir, path)
+
+    def estimated(path):
+        return os.path.join(cfg.data.estimated.base_dir, path)
+
+    def final(path):
+        return os.path.join(cfg.data.final.base_dir, path)
+
+    def years(*keys):
+        """Subconjunto de cfg.params.years relevante para la clave de cache"""
+        return {'years': {k: cfg.params.years[k] for k in keys}}
+
+    # Modo mensual de patentes (SUCIVE): solo entonces se escribe el panel
+    income = cfg.data.raw.subnational_income
+    vehicle_tax_panel = (
+        processed(cfg.data.processed.vehicle_tax_panel.file)
+        if income.month_col or income.date_col else None
+    )
+
+    return [
+        # Procesamiento económico
+        Stage(
+            name='gdp_deflator',
+            func='src.processors.economic:process_gdp_deflator',
+            args=(cfg,),
+            inputs=[raw(cfg.data.raw.gdp_deflator.file)],
+            params=years('base_year')
+        ),
+        Stage(
+            name='gdp',
+            func='src.processors.economic:process_gdp',
+            args=(raw(cfg.data.raw.gdp.file), processed(cfg.data.processed.gdp.file), cfg.params.years),
+            inputs=[raw(cfg.data.raw.gdp.file)],
+            outputs=[processed(cfg.data.processed.gdp.file)],
+            params=years('start', 'end', 'base_year')
+        ),
+        Stage(
+            name='gdp_comparison',
+            func='src.processors.economic:process_gdp_comparison',
+            args=(raw(cfg.data.raw.gdp.file), processed(cfg.data.processed.gdp_comparison.file), cfg),
+            inputs=[raw(cfg.data.raw.gdp.file), raw(cfg.data.raw.gdp_deflator.file)],
+            outputs=[processed(cfg.data.processed.gdp_comparison.file)],
+            after=['gdp_deflator'],
+            params={**years('start', 'end', 'base_year'), 'countries': list(cfg.params.countries)}
+        ),
+        # Procesamiento de precios
+        Stage(
+            name='cpi',
+            func='src.processors.prices:process_cpi',
+            args=(raw(cfg.data.raw.cpi.file), processed(cfg.data.processed.cpi.file), cfg.params.years),
+            inputs=[raw(cfg.data.raw.cpi.file)],
+            outputs=[processed(cfg.data.processed.cpi.file)],
+            params=years('start', 'end', 'base_year')
+        ),
+        # Procesamiento de tipo de cambio
+        Stage(
+            name='exchange_rate',
+            func='src.processors.exchange_rates:process_exchange_rate',
+            args=(
+                raw(cfg.data.raw.exchange_rate.file),
+                processed(cfg.data.processed.exchange_rate.file),
+                cfg.params.years
+            ),
+            inputs=[raw(cfg.data.raw.exchange_rate.file)],
+            outputs=[processed(cfg.data.processed.exchange_rate.file)],
+            params=years('base_year')
+        ),
+        # Factores de conversión para cualquier año base, deflactor y moneda
+        Stage(
+            name='real_value_cube',
+            func='src.processors.prices:build_real_value_cube',
+            args=(
+                Ref('cpi'),
+                Ref('gdp_deflator', 1),
+                Ref('exchange_rate', 1),
+                processed(cfg.data.processed.real_value_cube.file)
+            ),
+            inputs=[
+                processed(cfg.data.processed.cpi.file),
+                raw(cfg.data.raw.gdp_deflator.file),
+                processed(cfg.data.processed.exchange_rate.file)
+            ],
+            outputs=[processed(cfg.data.processed.real_value_cube.file)],
+            params=years('start', 'end', 'base_year')
+        ),
+        # Procesamiento de patentes (usa el tipo de cambio del año base)
+        Stage(
+            name='vehicle_tax',
+            func='src.processors.taxes:process_vehicle_tax',
+            args=(
+                raw(cfg.data.raw.subnational_income.file),
+                Ref('cpi'),
+                processed(cfg.data.processed.vehicle_tax.file),
+                cfg.params.years,
+                Ref('exchange_rate', 0)
+            ),
+            kwargs={
+                'chunksize': income.chunksize,
+                'month_col': income.month_col,
+                'date_col': income.date_col,
+                'panel_path': vehicle_tax_panel
+            },
+            inputs=[
+                raw(cfg.data.raw.subnational_income.file),
+                processed(cfg.data.processed.cpi.file)
+            ],
+            outputs=[processed(cfg.data.processed.vehicle_tax.file)] + ([vehicle_tax_panel] if vehicle_tax_panel else []),
+            params={
+                **years('start', 'end', 'base_year'),
+                'month_col': income.month_col,
+                'date_col': income.date_col
+            }
+        ),
+        # Procesamiento de combustibles
+        Stage(
+            name='gasoline',
+            func='src.processors.fuels:process_gasoline',
+            args=(
+                raw(cfg.data.raw.gasoline.file),
+                processed(cfg.data.processed.gasoline.file),
+                cfg.params.years,
+                Ref('cpi'),
+                Ref('exchange_rate', 0)
+            ),
+            kwargs={'panel_path': processed(cfg.data.processed.gasoline_panel.file)},
+            inputs=[raw(cfg.data.raw.gasoline.file)],
+            outputs=[
+                processed(cfg.data.processed.gasoline.file),
+                processed(cfg.data.processed.gasoline_panel.file)
+            ],
+            params=years('start', 'end')
+        ),
+        Stage(
+            name='diesel',
+            func='src.processors.fuels:process_diesel',
+            args=(
+                raw(cfg.data.raw.diesel.file),
+                processed(cfg.data.processed.diesel.file),
+                cfg.params.years,
+                Ref('cpi'),
+                Ref('exchange_rate', 0)
+            ),
+            kwargs={'panel_path': processed(cfg.data.processed.diesel_panel.file)},
+            inputs=[raw(cfg.data.raw.diesel.file)],
+            outputs=[
+                processed(cfg.data.processed.diesel.file),
+                processed(cfg.data.processed.diesel_panel.file)
+            ],
+            params=years('start', 'end')
+        ),
+        # Procesamiento de participación PIB departamental
+        Stage(
+            name='gdp_share',
+            func='src.processors.economic:process_gdp_share_raw',
+            args=(
+                raw(cfg.data.raw.subnational_gdp_share.dir),
+                processed(cfg.data.processed.subnational_gdp_share.file),
+                cfg.params.years
+            ),
+            inputs=[raw(cfg.data.raw.subnational_gdp_share.dir)],
+            outputs=[processed(cfg.data.processed.subnational_gdp_share.file)],
+            params={}
+        ),
+        # Procesamiento geográfico
+        Stage(
+            name='shapefile',
+            func='src.processors.geo:process_shapefile',
+            kwargs={
+                'input_dir': raw(cfg.data.raw.shapefile.dir),
+                'output_dir': processed(cfg.data.processed.shapefile.dir)
+            },
+            inputs=[raw(cfg.data.raw.shapefile.dir)],
+            outputs=[processed(cfg.data.processed.shapefile.dir)],
+            params={}
+        ),
+        # Contigüidad y distancias entre departamentos
+        Stage(
+            name='spatial_weights',
+            func='src.processors.spatial:build_spatial_weights',
+            args=(processed(cfg.data.processed.shapefile.dir),),
+            after=['shapefile'],
+            inputs=[processed(cfg.data.processed.shapefile.dir)],
+            params={}
+        ),
+        # Sección de estimaciones
+        Stage(
+            name='population',
+            func='src.estimators.population:project_population',
+            args=(
+                raw(cfg.data.raw.population_census.file),
+                estimated(cfg.data.estimated.projected_population.file),
+                cfg.params.years
+            ),
+            inputs=[raw(cfg.data.raw.population_census.file)],
+            outputs=[estimated(cfg.data.estimated.projected_population.file)],
+            params=years('start', 'end')
+        ),
+        # Participación PIB departamental proyectada
+        Stage(
+            name='gdp_share_projection',
+            func='src.estimators.subnational_gdp_share:project_subnational_gdp_share',
+            args=(
+                Ref('gdp_share', 0),
+                Ref('population', 0),
+                estimated(cfg.data.estimated.projected_subnational_gdp_share.file),
+                cfg.params.years
+            ),
+            inputs=[
+                processed(cfg.data.processed.subnational_gdp_share.file),
+                estimated(cfg.data.estimated.projected_population.file)
+            ],
+            outputs=[estimated(cfg.data.estimated.projected_subnational_gdp_share.file)],
+            params=years('start', 'end')
+        ),
+        # Estimar PIB departamental
+        Stage(
+            name='subnational_gdp',
+            func='src.estimators.subnational_gdp:estimate_subnational_gdp',
+            kwargs={
+                'gdp_share_path': Ref('gdp_share_projection', 0),
+                'national_gdp_path': Ref('gdp'),
+                'output_path': estimated(cfg.data.estimated.projected_subnational_gdp.file),
+                'years_params': cfg.params.years
+            },
+            inputs=[
+                estimated(cfg.data.estimated.projected_subnational_gdp_share.file),
+                processed(cfg.data.processed.gdp.file)
+            ],
+            outputs=[estimated(cfg.data.estimated.projected_subnational_gdp.file)],
+            params=years('start', 'end', 'base_year')
+        ),
+        # Estimar datos faltantes de patentes
+        Stage(
+            name='missing_vehicle_tax',
+            func='src.estimators.vehicle_tax:estimate_missing_vehicle_tax',
+            args=(
+                Ref('vehicle_tax', 0),
+                Ref('population', 0),
+                estimated(cfg.data.estimated.estimated_montevideo_vehicle_tax.file),
+                cfg.params.years
+            ),
+            kwargs={'target_dept': 'Montevideo', 'treatment_year': 2007},
+            inputs=[
+                processed(cfg.data.processed.vehicle_tax.file),
+                estimated(cfg.data.estimated.projected_population.file)
+            ],
+            outputs=[estimated(cfg.data.estimated.estimated_montevideo_vehicle_tax.file)],
+            params={**years('start', 'end'), 'target_dept': 'Montevideo', 'treatment_year': 2007}
+        ),
+        # Crear dataset final combinando estimaciones y datos reales
+        Stage(
+            name='final_vehicle_tax',
+            func='src.processors.taxes:create_final_vehicle_tax',
+            args=(
+                Ref('vehicle_tax', 0),
+                Ref('missing_vehicle_tax', 0),
+                final(cfg.data.final.vehicle_tax.file)
+            ),
+            kwargs={
+                'treatment_year': 2007,
+                'synthetic_metadata': Ref('missing_vehicle_tax', 1),
+                'provenance_path': final(cfg.data.final.vehicle_tax_provenance.file)
+            },
+            inputs=[
+                processed(cfg.data.processed.vehicle_tax.file),
+                estimated(cfg.data.estimated.estimated_montevideo_vehicle_tax.file)
+            ],
+            outputs=[
+                final(cfg.data.final.vehicle_tax.file),
+                final(cfg.data.final.vehicle_tax_provenance.file)
+            ],
+            params={'treatment_year': 2007}
+        ),
+        # Mapas anuales de recaudación (un cuadro por año y GIF)
+        Stage(
+            name='vehicle_tax_maps',
+            func='src.processors.geo:render_vehicle_tax_maps',
+            args=(
+                Ref('final_vehicle_tax', 0),
+                processed(cfg.data.processed.shapefile.dir),
+                final(cfg.data.final.vehicle_tax_maps.dir)
+            ),
+            after=['shapefile'],
+            inputs=[
+                final(cfg.data.final.vehicle_tax.file),
+                processed(cfg.data.processed.shapefile.dir)
+            ],
+            outputs=[final(cfg.data.final.vehicle_tax_maps.dir)],
+            params={}
+        ),
+    ]
+
+def run(cfg: DictConfig, output_dir: str, executor: str = None, reuse_variants: bool = False):
+    """
+    Ejecuta el pipeline para una configuración ya compuesta.
+
+    Args:
+        cfg: Configuración completa
+        output_dir: Directorio para reportes de la corrida
+        executor: Sobrescribe cfg.pipeline.executor
+        reuse_variants: Reutilizar cualquier variante cacheada de cada
+            etapa (ver `StageCache`); lo usa el lanzador de barridos
+    """
+    # Importado aquí para no cargar pandas al importar el módulo
+    from src.utils.io import background_writes, set_csv_export
+
+    executor = executor or cfg.pipeline.executor
+
+    # Los artefactos se guardan en Parquet; el CSV es una exportación opcional
+    set_csv_export(cfg.pipeline.artifacts.export_csv)
+
+    # Las etapas sin cambios en entradas, parámetros o código se omiten
+    cache = None
+    if cfg.pipeline.cache:
+        cache = StageCache(cfg.pipeline.cache_dir, reuse_variants=reuse_variants)
+
+    # Métricas por etapa en el directorio de salida
+    profiler = None
+    if cfg.pipeline.profiling.enabled:
+        profiler = StageProfiler(
+            output_dir,
+            memory=cfg.pipeline.profiling.memory,
+            tool=cfg.pipeline.profiling.tool,
+            executor=executor,
+            history_path=cfg.pipeline.profiling.history,
+            max_workers=cfg.pipeline.max_workers
+        )
+
+    # Las etapas independientes corren en paralelo según el DAG; los
+    # resultados pasan en memoria y la escritura a disco va en segundo plano
+    with background_writes():
+        results = run_pipeline(
+            select_stages(build_stages(cfg), cfg.pipeline.stages),
+            max_workers=cfg.pipeline.max_workers,
+            executor=executor,
+            cache=cache,
+            profiler=profiler
+        )
+
+    if profiler is not None:
+        profiler.write_report()
+    return results
+
 @hydra.main(config_path="../config", config_name="main", version_base="1.2")
 def process_data(cfg: DictConfig):
     """Main processing function with improved configuration handling"""
     # Validate environment
     if "PROJECT_ROOT" not in os.environ:
         raise ValueError("PROJECT_ROOT environment variable must be set")
-    
+
     print(f"Processing data with configuration from {cfg.paths.root}")
-    
-    # Procesamiento económico
-    valor_2020, deflator_df = economic.process_gdp_deflator(
-        cfg.data.raw.gdp_deflator.file
-    )
-    
-    gdp_df = economic.process_gdp(
-        cfg.data.raw.gdp.file,
-        cfg.data.raw.gdp_deflator.file,
-        cfg.data.processed.gdp.file,
-        cfg.years
-    )
-    
-    # Procesamiento de precios
-    cpi_df = prices.process_cpi(
-        cfg.data.raw.cpi.file,
-        cfg.data.processed.cpi.file,
-        cfg.years
-    )
-    
-    # Procesamiento de tipo de cambio
-    tc_2020, tc_df = exchange_rates.process_exchange_rate(
-        cfg.data.raw.exchange_rate.file,
-        cfg.data.processed.exchange_rate.file,
-        cfg.years
-    )
-    
-    # Procesamiento de patentes
-    taxes.process_vehicle_tax(
-        cfg.data.raw.subnational_income.file,
-        cfg.data.processed.cpi.file,
-        cfg.data.processed.vehicle_tax.file,
-        cfg.years,
-        tc_2020  # Usamos el tipo de cambio 2020 calculado
-    )
-    
-    # Procesamiento de combustibles
-    fuels.process_gasoline(
-        cfg.data.raw.gasoline.file,
-        cfg.data.processed.gasoline.file,
-        cfg.years,
-        cpi_df,
-        tc_2020
-    )
-    
-    fuels.process_diesel(
-        cfg.data.raw.diesel.file,
-        cfg.data.processed.diesel.file,
-        cfg.years,
-        cpi_df,
-        tc_2020
-    )
-    
-    # Procesamiento de participación PIB departamental
-    economic.process_gdp_share_raw(
-        cfg.data.raw.subnational_gdp_share.dir,
-        cfg.data.processed.subnational_gdp_share.file,
-        cfg.years
-    )
-    
-    # Procesamiento geográfico
-    geo.process_shapefile(
-        input_dir=os.path.join(cfg.data.raw.base_dir, os.path.dirname(cfg.data.raw.shapefile.file)),
-        output_dir=os.path.join(cfg.data.processed.base_dir, "shapefiles")
-    )
 
-    # Sección de estimaciones
-    pop_estimator.project_population(
-        cfg.data.raw.population_census.file,
-        cfg.data.estimated.projected_population.file,
-        cfg.years
-    )   
-    
-    # Procesamiento de participación PIB departamental proyectada
-    economic.project_subnational_gdp_share(
-        cfg.data.processed.subnational_gdp_share.dir,
-        cfg.data.estimated.projected_subnational_gdp_share.file,
-        cfg.years
-    )
-    
-    # Estimar PIB departamental
-    economic.estimate_subnational_gdp(
-        gdp_share_path=cfg.data.estimated.projected_subnational_gdp_share.file,
-        national_gdp_path=cfg.data.processed.gdp.file,
-        output_path=cfg.data.estimated.projected_subnational_gdp.file,
-        years_params=cfg.years
-    )
-    
-    # Estimar datos faltantes de patentes
-    taxes.estimate_missing_vehicle_tax(
-        cfg.data.processed.vehicle_tax.file,
-        cfg.data.estimated.projected_population.file,
-        cfg.data.estimated.estimated_montevideo_vehicle_tax.file,
-        cfg.years,
-        target_dept='Montevideo',
-        treatment_year=2007
-    )
-    
-    # Crear dataset final combinando estimaciones y datos reales
-    taxes.create_final_vehicle_tax(
-        cfg.data.processed.vehicle_tax.file,
-        cfg.data.estimated.estimated_montevideo_vehicle_tax.file,
-        cfg.data.final.vehicle_tax.file,
-        treatment_year=2007
-    )
+    run(cfg, HydraConfig.get().runtime.output_dir)
 
     # Devolver la configuración completa para usar en la notebook
     return cfg
@@ -2,8 +2,13 @@
 Procesamiento de variables económicas (PIB, deflactor)
 """
 import pandas as pd
-from ..utils.io import ensure_dir, read_file
-from ..utils.transformations import to_constant_prices
+import numpy as np
+from ..utils.io import (
+    ensure_dir, read_file, save_with_metadata, load_data_with_metadata,
+    artifact_path, source_signature, wait_written, _tmp_path
+)
+from ..utils.conversion import dense_by_year, to_years
+from ..utils.transformations import to_constant_prices, resample_annual
 from ..utils.logging import log_execution_time, log_data_shape
 from ..utils.validations import validate_non_empty, check_required_columns
 import os
@@ -12,10 +17,106 @@ from pathlib import Path
 from hydra.utils import get_original_cwd
 import re
 import glob
-import yaml
+import hashlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+
+class DeflatorIndex:
+    """
+    Deflactor del PIB de EE.UU. reexpresado en un año base.
+
+    El archivo crudo se lee una sola vez y no se modifica; la serie
+    rebasada se guarda en processed (una por año base) y se comparte en
+    memoria entre llamadas e hilos. Las consultas por año o fecha se
+    resuelven sobre arreglos precalculados.
+
+    Args:
+        raw_path: CSV crudo con columnas observation_date y GDPDEF
+        processed_path: Ruta base de la serie rebasada; el año base se
+            agrega al nombre del archivo
+        base_year: Año en que el índice vale 100
+    """
+
+    _instances = {}
+    _lock = threading.Lock()
+
+    def __init__(self, raw_path, processed_path, base_year=2020):
+        self.raw_path = str(raw_path)
+        self.base_year = int(base_year)
+        stem, suffix = os.path.splitext(str(processed_path))
+        self.processed_path = f"{stem}_base{self.base_year}{suffix}"
+        self.signature = source_signature(self.raw_path)
+        self.df = self._load()
+
+        # Arreglos para consultas: fechas de observación y promedio anual
+        self._dates = self.df['observation_date'].to_numpy(dtype='datetime64[ns]')
+        self._values = self.df['GDPDEF'].to_numpy(dtype=np.float64)
+        annual = resample_annual(self.df.set_index('observation_date')['GDPDEF'])
+        self.first_year, self._annual = dense_by_year(annual)
+        self.base_value = float(self.df.attrs.get('base_value', np.nan))
+
+    @classmethod
+    def get(cls, raw_path, processed_path, base_year=2020):
+        """Instancia compartida para el archivo crudo y el año base dados"""
+        raw_path = str(raw_path)
+        key = (raw_path, str(processed_path), int(base_year), source_signature(raw_path))
+        with cls._lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(raw_path, processed_path, base_year)
+            return cls._instances[key]
+
+    def _load(self):
+        """Serie rebasada desde processed, o recalculada desde el crudo"""
+        if os.path.exists(self.processed_path) or os.path.exists(artifact_path(self.processed_path)):
+            df = load_data_with_metadata(self.processed_path)
+            if df.attrs.get('source_signature') == self.signature:
+                df['observation_date'] = pd.to_datetime(df['observation_date'])
+                return df
+
+        df = pd.read_csv(self.raw_path)
+        df['observation_date'] = pd.to_datetime(df['observation_date'])
+        base = df[df['observation_date'].dt.year == self.base_year]['GDPDEF']
+        if base.empty:
+            raise ValueError(f"El deflactor no tiene observaciones para {self.base_year}")
+        base_value = float(base.iloc[0])
+        df['GDPDEF'] = (df['GDPDEF'] / base_value) * 100
+
+        metadata = {
+            'source_signature': self.signature,
+            'base_year': self.base_year,
+            'base_value': base_value
+        }
+        save_with_metadata(df, self.processed_path, metadata)
+        df.attrs = metadata
+        return df
+
+    @property
+    def years(self) -> np.ndarray:
+        """Años con promedio anual disponible"""
+        return np.arange(self.first_year, self.first_year + len(self._annual))
+
+    def by_year(self, years) -> np.ndarray:
+        """Promedio anual del índice para cada año (NaN fuera de rango)"""
+        years = to_years(years)
+        position = years - self.first_year
+        inside = (position >= 0) & (position < len(self._annual))
+        result = np.full(len(years), np.nan)
+        result[inside] = self._annual[position[inside]]
+        return result
+
+    def by_date(self, dates) -> np.ndarray:
+        """Valor de la observación vigente en cada fecha (NaN antes del inicio)"""
+        dates = pd.to_datetime(pd.Index(dates)).to_numpy(dtype='datetime64[ns]')
+        position = np.searchsorted(self._dates, dates, side='right') - 1
+        result = np.full(len(dates), np.nan)
+        valid = position >= 0
+        result[valid] = self._values[position[valid]]
+        return result
 
 def process_gdp_deflator(cfg: DictConfig):
-    """Versión corregida con Hydra"""
+    """Deflactor de EE.UU. rebasado al año base, sin modificar el archivo crudo"""
     # Obtener paths absolutos de forma confiable
     raw_base = Path(cfg.data.raw.base_dir)
     deflator_path = raw_base / cfg.data.raw.gdp_deflator.file
@@ -28,15 +129,65 @@ def process_gdp_deflator(cfg: DictConfig):
             f"Archivos disponibles en {raw_base}:\n{available_files}"
         )
     
-    df = pd.read_csv(deflator_path)
-    df['observation_date'] = pd.to_datetime(df['observation_date'])
-    valor_2020 = df[df['observation_date'].dt.year == 2020]['GDPDEF'].iloc[0]
-    df['GDPDEF'] = (df['GDPDEF'] / valor_2020) * 100
-    
-    # Corregido: asegurar que existe el directorio padre
-    ensure_dir(deflator_path.parent)
-    df.to_csv(deflator_path, index=False)
-    return valor_2020, df
+    index = DeflatorIndex.get(
+        deflator_path,
+        Path(cfg.data.processed.base_dir) / cfg.data.processed.gdp_deflator.file,
+        base_year=cfg.params.years.base_year
+    )
+    return index.base_value, index.df.copy()
+
+class WDITable:
+    """
+    Tabla de Indicadores del Desarrollo Mundial como arreglo
+    países × años. Se parsea una vez por archivo (la lectura usa el
+    cache Parquet de `read_file`) y se comparte entre etapas; extraer
+    un país es una búsqueda en un diccionario y un indexado de fila.
+
+    Args:
+        df: Tabla WDI en formato ancho (una columna por año)
+    """
+
+    _instances = {}
+    _lock = threading.Lock()
+
+    def __init__(self, df: pd.DataFrame):
+        validate_non_empty(df, "PIB")
+        check_required_columns(df, ['Country Name', 'Country Code'])
+
+        year_columns = [c for c in df.columns if str(c).strip().isdigit()]
+        self.years = np.array([int(c) for c in year_columns], dtype=np.int64)
+        self.codes = df['Country Code'].to_numpy()
+        self.names = dict(zip(df['Country Code'], df['Country Name'], strict=True))
+        self.values = df[year_columns].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+        self._rows = {code: row for row, code in enumerate(self.codes)}
+
+    @classmethod
+    def get(cls, path):
+        """Tabla compartida para el archivo dado (se relee si cambia)"""
+        path = str(path)
+        key = (path, source_signature(path))
+        with cls._lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(read_file(path, skiprows=4))
+            return cls._instances[key]
+
+    def rows(self, codes) -> np.ndarray:
+        """Filas de la tabla para los códigos de país dados"""
+        missing = [code for code in codes if code not in self._rows]
+        if missing:
+            raise ValueError(f"Países no encontrados en el dataset: {missing}")
+        return np.array([self._rows[code] for code in codes], dtype=np.int64)
+
+    def extract(self, codes, deflator: 'DeflatorIndex' = None) -> pd.DataFrame:
+        """
+        Series por país (años × códigos). Con `deflator` los valores se
+        expresan en términos reales del año base del deflactor.
+        """
+        values = self.values[self.rows(codes)].T
+        if deflator is not None:
+            values = values * 100 / deflator.by_year(self.years)[:, None]
+        df = pd.DataFrame(values, index=pd.Index(self.years, name='year'), columns=list(codes))
+        return df.dropna(how='all')
 
 @log_execution_time
 @log_data_shape
@@ -44,34 +195,59 @@ def process_gdp(input_gdp, output_path, cfg):
     """Procesamiento actualizado usando configuración completa"""
     # Permitir tanto path como DataFrame
     if isinstance(input_gdp, str):
-        df = pd.read_csv(input_gdp, skiprows=4)
+        table = WDITable.get(input_gdp)
     else:
-        df = input_gdp
-    
-    # Validaciones
-    validate_non_empty(df, "PIB")
-    check_required_columns(df, ['Country Name', 'Country Code'])
-    
-    # Filtrar solo Uruguay y convertir a formato largo
-    uruguay_df = df[df['Country Code'] == 'URY'].melt(
-        id_vars=['Country Name', 'Country Code'],
-        var_name='year',
-        value_name='gdp'
-    )
-    
-    # Convertir año a numérico y limpiar datos
-    uruguay_df['year'] = pd.to_numeric(uruguay_df['year'], errors='coerce')
-    uruguay_df = uruguay_df.dropna()
+        table = WDITable(input_gdp)
     
-    # Ordenar por año y establecer índice
-    uruguay_df = uruguay_df.sort_values('year').set_index('year')['gdp']
+    # Serie de Uruguay indexada por año
+    uruguay_df = table.extract(['URY'])['URY'].dropna().rename('gdp')
     
     # Guardar con metadatos
-    ensure_dir(os.path.dirname(output_path))
-    uruguay_df.to_csv(output_path)
+    save_with_metadata(uruguay_df, output_path, index=True)
     
     return uruguay_df
 
+@log_execution_time
+@log_data_shape
+def process_gdp_comparison(input_gdp, output_path, cfg):
+    """
+    PIB de los países de comparación (params.countries) en términos
+    nominales y reales (deflactor de EE.UU., año base de la configuración)
+    """
+    table = WDITable.get(input_gdp) if isinstance(input_gdp, str) else WDITable(input_gdp)
+    codes = list(cfg.params.countries)
+    deflator = DeflatorIndex.get(
+        Path(cfg.data.raw.base_dir) / cfg.data.raw.gdp_deflator.file,
+        Path(cfg.data.processed.base_dir) / cfg.data.processed.gdp_deflator.file,
+        base_year=cfg.params.years.base_year
+    )
+
+    years = cfg.params.years
+    nominal = table.extract(codes)
+    real = table.extract(codes, deflator=deflator)
+    df = pd.concat({'nominal': nominal, 'real': real}, names=['serie', 'pais'], axis=1)
+    df = df.loc[(df.index >= years.start) & (df.index <= years.end)]
+    df = df.stack(level=['serie', 'pais'], future_stack=True).dropna().rename('gdp').reset_index()
+
+    metadata = {
+        'dataset': {
+            'name': 'PIB de países de comparación',
+            'temporal_coverage': {
+                'start': int(years.start),
+                'end': int(years.end),
+                'frequency': 'anual'
+            },
+            'unidad': f'USD corrientes (nominal) y USD constantes {years.base_year} (real)',
+            'fuente': 'Banco Mundial (WDI)',
+            'paises': {code: table.names[code] for code in codes},
+            'notas': [
+                'Valores reales deflactados con el deflactor del PIB de EE.UU.'
+            ]
+        }
+    }
+    save_with_metadata(df, output_path, metadata)
+    return df
+
 def validate_gdp_data(df):
     """Validaciones de calidad de datos"""
     if df.empty:
@@ -80,105 +256,142 @@ def validate_gdp_data(df):
     if 'URY' not in df['Country Code'].values:
         raise ValueError("Datos de Uruguay no encontrados en el dataset")
 
-def save_with_metadata(series, output_path, metadata):
-    """Guarda serie con metadatos en CSV"""
-    df = series.reset_index()
-    df.attrs = metadata
-    df.to_csv(output_path, index=False)
+# Departamentos (se excluyen las regiones de los archivos de OPP)
+DEPARTAMENTOS = [
+    'Montevideo', 'Artigas', 'Canelones', 'Cerro Largo', 'Colonia',
+    'Durazno', 'Flores', 'Florida', 'Lavalleja', 'Maldonado',
+    'Paysandú', 'Río Negro', 'Rivera', 'Rocha', 'Salto',
+    'San José', 'Soriano', 'Tacuarembó', 'Treinta y Tres'
+]
 
-def read_gdp_share_file(file_path):
-    """Lee un archivo individual de participación en el PIB departamental"""
-    print(f"Procesando archivo: {os.path.basename(file_path)}")
-    
-    # Intentar diferentes codificaciones
-    encodings = ['latin1', 'iso-8859-1', 'utf-8']
-    
+def decode_bytes(raw, encodings=('utf-8', 'latin1')):
+    """Decodifica con la primera codificación válida; devuelve (texto, codificación)"""
     for encoding in encodings:
         try:
-            # Leer el archivo con la codificación actual
-            df = pd.read_csv(file_path, sep=';', skiprows=4, encoding=encoding, decimal=',')
-            
-            # Extraer año del archivo
-            with open(file_path, 'r', encoding=encoding) as f:
-                header = ''.join([next(f) for _ in range(4)])
-                year = int(re.search(r'Año:\s*(\d{4})', header).group(1))
-            
-            # Limpiar datos
-            df = df.rename(columns={df.columns[0]: 'departamento', 'Total': 'participacion'})
-            
-            # Filtrar solo departamentos (excluir regiones)
-            departamentos = [
-                'Montevideo', 'Artigas', 'Canelones', 'Cerro Largo', 'Colonia',
-                'Durazno', 'Flores', 'Florida', 'Lavalleja', 'Maldonado',
-                'Paysandú', 'Río Negro', 'Rivera', 'Rocha', 'Salto',
-                'San José', 'Soriano', 'Tacuarembó', 'Treinta y Tres'
-            ]
-            df = df[df['departamento'].isin(departamentos)]
-            
-            # Agregar año
-            df['año'] = year
-            
-            print(f"Archivo procesado exitosamente con codificación {encoding}")
-            return df[['departamento', 'año', 'participacion']]
-            
+            return raw.decode(encoding), encoding
         except UnicodeDecodeError:
             continue
-        except Exception as e:
-            print(f"Error procesando {file_path} con codificación {encoding}: {str(e)}")
-            continue
-    
-    raise ValueError(f"No se pudo leer el archivo {file_path} con ninguna codificación")
+    raise ValueError(f"No se pudo decodificar con ninguna de {encodings}")
 
-def process_gdp_share_raw(input_dir, output_path, years_params):
-    """Procesa datos crudos de participación en el PIB departamental"""
-    print("\nProcesando datos de participación en PIB departamental...")
-    
-    # Crear directorio de salida completo (incluyendo subdirectorios)
-    output_dir = Path(output_path).parent
-    ensure_dir(output_dir) 
+def read_gdp_share_file(file_path):
+    """Lee un archivo individual de participación en el PIB departamental
+
+    El archivo se lee una sola vez; el año sale de la cabecera y el CSV
+    se parsea desde el mismo texto ya decodificado.
+    """
+    with open(file_path, 'rb') as f:
+        raw = f.read()
+    text, encoding = decode_bytes(raw)
     
-    # Listar archivos CSV en el directorio
-    pattern = os.path.join(input_dir, "Indicador--Participacion*.csv")
-    files = glob.glob(pattern)
+    # Extraer año de las 4 líneas de cabecera
+    header = '\n'.join(text.splitlines()[:4])
+    match = re.search(r'Año:\s*(\d{4})', header)
+    if match is None:
+        raise ValueError(f"No se encontró el año en la cabecera de {os.path.basename(file_path)}")
+    year = int(match.group(1))
     
-    if not files:
-        raise FileNotFoundError(f"No se encontraron archivos en {pattern}")
+    df = pd.read_csv(StringIO(text), sep=';', skiprows=4, decimal=',')
     
-    print(f"Encontrados {len(files)} archivos para procesar")
+    # Limpiar datos y filtrar solo departamentos
+    df = df.rename(columns={df.columns[0]: 'departamento', 'Total': 'participacion'})
+    df = df[df['departamento'].isin(DEPARTAMENTOS)].copy()
+    df['año'] = year
     
-    # Leer y combinar archivos
+    df = df[['departamento', 'año', 'participacion']]
+    df.attrs['encoding'] = encoding
+    df.attrs['sha256'] = hashlib.sha256(raw).hexdigest()
+    return df
+
+def _read_gdp_share_safe(file_path):
+    """Resultado o error de un archivo, para reportar en orden"""
+    try:
+        return read_gdp_share_file(file_path), None
+    except (OSError, ValueError, KeyError, pd.errors.ParserError) as e:
+        return None, e
+
+def _gdp_share_manifest_path(output_path):
+    return os.path.splitext(str(output_path))[0] + '.manifest.json'
+
+def _load_gdp_share_store(output_path):
+    """Manifiesto de archivos ingeridos y datos combinados previos
+
+    Si falta alguno, o los años no coinciden, se reprocesa todo.
+    """
+    manifest_path = _gdp_share_manifest_path(output_path)
+    if not os.path.exists(manifest_path):
+        return {}, None
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    try:
+        store = load_data_with_metadata(output_path)
+    except (OSError, ValueError):
+        return {}, None
+    manifest_years = {entry['año'] for entry in manifest.values()}
+    if set(store['año'].unique().tolist()) != manifest_years:
+        return {}, None
+    return manifest, store
+
+def _pending_share_files(files, manifest):
+    """Archivos nuevos o con tamaño/fecha distintos a los del manifiesto"""
+    pending = []
+    for file in files:
+        stat = os.stat(file)
+        entry = manifest.get(os.path.basename(file))
+        if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime_ns:
+            pending.append(file)
+    return pending
+
+def _ingest_share_files(pending, manifest, touched_years, max_workers=None):
+    """
+    Lee los archivos pendientes en paralelo y actualiza el manifiesto y
+    los años afectados.
+
+    Returns:
+        DataFrames de los archivos cuyo contenido cambió
+    """
+    # `map` conserva el orden de `pending`
+    results = []
+    if pending:
+        max_workers = max_workers or min(8, len(pending))
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(_read_gdp_share_safe, pending))
+
     dfs = []
-    for file in sorted(files):
-        try:
-            df = read_gdp_share_file(file)
-            if df is not None and not df.empty:
-                dfs.append(df)
-                print(f"✓ Procesado: {os.path.basename(file)}")
-        except Exception as e:
-            print(f"✗ Error en {os.path.basename(file)}: {str(e)}")
-    
-    if not dfs:
-        raise ValueError("No se pudo procesar ningún archivo correctamente")
-    
-    # Combinar todos los años
-    df_combined = pd.concat(dfs, ignore_index=True)
-    
-    # Validar sumas por año
-    yearly_sums = df_combined.groupby('año')['participacion'].sum()
-    print("\nSuma de participaciones por año:")
-    print(yearly_sums)
-    
-    # Guardar resultados
-    ensure_dir(os.path.dirname(output_path))
-    df_combined.to_csv(output_path, index=False)
-    
-    # Crear metadata
-    metadata = {
+    for file, (result, error) in zip(pending, results, strict=True):
+        if error is not None:
+            print(f"✗ Error en {os.path.basename(file)}: {error}")
+            continue
+        name = os.path.basename(file)
+        previous = manifest.pop(name, None)
+        if previous is not None:
+            touched_years.add(previous['año'])
+        if result.empty:
+            continue
+
+        stat = os.stat(file)
+        manifest[name] = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'sha256': result.attrs['sha256'],
+            'año': int(result['año'].iloc[0])
+        }
+        # Mismo contenido (solo cambió la fecha): no hay que reemplazar nada
+        if previous is not None and previous['sha256'] == result.attrs['sha256']:
+            touched_years.discard(previous['año'])
+            continue
+        dfs.append(result)
+        touched_years.add(manifest[name]['año'])
+        print(f"✓ Procesado: {name} ({result.attrs['encoding']})")
+    return dfs
+
+def _gdp_share_metadata(df):
+    """Metadatos del dataset combinado de participaciones"""
+    return {
         'dataset': {
             'name': 'Participación departamental en PIB',
             'temporal_coverage': {
-                'start': int(df_combined['año'].min()),
-                'end': int(df_combined['año'].max()),
+                'start': int(df['año'].min()),
+                'end': int(df['año'].max()),
                 'frequency': 'anual'
             },
             'unidad': 'porcentaje',
@@ -195,10 +408,70 @@ def process_gdp_share_raw(input_dir, output_path, years_params):
             ]
         }
     }
+
+def _save_gdp_share_manifest(manifest, output_path):
+    """Escribe el manifiesto de forma atómica"""
+    manifest_path = _gdp_share_manifest_path(output_path)
+    tmp_path = _tmp_path(manifest_path)
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+def process_gdp_share_raw(input_dir, output_path, years_params, max_workers=None):
+    """Procesa datos crudos de participación en el PIB departamental
+
+    La ingesta es incremental: un manifiesto (nombre, tamaño, hash)
+    registra los archivos ya procesados y solo se leen los nuevos o
+    modificados, reemplazando las filas de sus años en el dataset.
+    """
+    print("\nProcesando datos de participación en PIB departamental...")
+    
+    # Crear directorio de salida completo (incluyendo subdirectorios)
+    output_dir = Path(output_path).parent
+    ensure_dir(output_dir) 
+    
+    # Listar archivos CSV en el directorio
+    pattern = os.path.join(input_dir, "Indicador--Participacion*.csv")
+    files = sorted(glob.glob(pattern))
+    
+    if not files:
+        raise FileNotFoundError(f"No se encontraron archivos en {pattern}")
+    
+    manifest, store = _load_gdp_share_store(output_path)
+    pending = _pending_share_files(files, manifest)
+    
+    # Archivos que ya no están: sus años se eliminan
+    names = {os.path.basename(file) for file in files}
+    removed = [name for name in manifest if name not in names]
+    touched_years = {manifest.pop(name)['año'] for name in removed}
+    
+    print(f"Encontrados {len(files)} archivos; {len(pending)} nuevos o modificados")
+    dfs = _ingest_share_files(pending, manifest, touched_years, max_workers)
+    
+    if store is None and not dfs:
+        raise ValueError("No se pudo procesar ningún archivo correctamente")
+    
+    # Reemplazar las particiones por año afectadas
+    parts = [store[~store['año'].isin(touched_years)]] if store is not None else []
+    df_combined = pd.concat(parts + dfs, ignore_index=True)
+    df_combined = df_combined.sort_values('año', kind='stable').reset_index(drop=True)
+    
+    # Validar sumas solo de los años afectados
+    touched = df_combined[df_combined['año'].isin(touched_years)]
+    if not touched.empty:
+        yearly_sums = touched.groupby('año')['participacion'].sum()
+        print("\nSuma de participaciones por año (años actualizados):")
+        print(yearly_sums)
+    else:
+        print("\nSin cambios en los archivos de participación")
+    
+    # Guardar resultados con metadata embebida
+    metadata = _gdp_share_metadata(df_combined)
+    written = save_with_metadata(df_combined, output_path, metadata)
     
-    # Guardar metadata
-    metadata_path = os.path.join(os.path.dirname(output_path), 'metadata.yaml')
-    with open(metadata_path, 'w', encoding='utf-8') as f:
-        yaml.dump(metadata, f, allow_unicode=True, sort_keys=False)
+    # El manifiesto se escribe después de que los datos están en disco
+    # (solo se espera la escritura de esta etapa)
+    wait_written(written)
+    _save_gdp_share_manifest(manifest, output_path)
     
     return df_combined, metadata 
\ No newline at end of file
@@ -1,32 +1,168 @@
 """
 Procesamiento de tipos de cambio históricos
 """
+import glob
+import os
+import numpy as np
 import pandas as pd
-from ..utils.io import ensure_dir, read_file
-from ..utils.transformations import resample_annual
+from ..utils.io import read_file, save_with_metadata, source_signature, prune_cache_entries, READ_CACHE_DIRNAME
 from ..utils.validations import validate_non_empty, check_required_columns
 
+RATE_COLUMN = 'Dólar.USA.Venta'
+# Versión del arreglo cacheado: cambia si cambia la forma de construirlo
+STORE_VERSION = 2
+
+class ExchangeRateStore:
+    """
+    Tipo de cambio diario en un arreglo float64 denso (un elemento por
+    día calendario, NaN sin cotización) con sumas acumuladas, de modo
+    que el promedio de cualquier rango de fechas es O(1). Incluye los
+    agregados mensuales y anuales (promedio y cierre) precalculados.
+
+    Args:
+        start: Primer día del arreglo
+        values: Cotizaciones diarias desde `start`
+        counts: Cotizaciones publicadas cada día (por defecto 1 si hay
+            valor); los días repetidos en el libro pesan en los
+            promedios tantas veces como filas tienen
+    """
+
+    def __init__(self, start, values, counts=None):
+        self.start = np.datetime64(start, 'D')
+        self.values = np.asarray(values, dtype=np.float64)
+        observed = ~np.isnan(self.values)
+        if counts is None:
+            counts = observed
+        self.counts = np.where(observed, np.asarray(counts, dtype=np.int64), 0)
+        # Sumas y conteos acumulados (con un cero inicial)
+        self._sums = np.concatenate([[0.0], np.cumsum(np.where(observed, self.values, 0.0) * self.counts)])
+        self._counts = np.concatenate([[0], np.cumsum(self.counts)])
+        # Último día con cotización hasta cada día (-1 si ninguno)
+        self._last = np.maximum.accumulate(np.where(observed, np.arange(len(self.values)), -1))
+
+        self.monthly = self._aggregate('MS', 'ME')
+        self.annual = self._aggregate('YS', 'YE')
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        Construye el arreglo diario desde (Fecha, cotización). Las fechas
+        repetidas en el libro se agregan: el valor del día es su promedio
+        y cada fila sigue contando en los promedios por período, igual
+        que un `resample(...).mean()` sobre las filas.
+        """
+        rates = df[RATE_COLUMN].astype(np.float64).groupby(level=0).agg(['mean', 'count'])
+        days = rates.index.to_numpy(dtype='datetime64[D]')
+        start = days.min()
+        size = int((days.max() - start).astype(int)) + 1
+        offsets = (days - start).astype(int)
+        values = np.full(size, np.nan)
+        values[offsets] = rates['mean'].to_numpy()
+        counts = np.zeros(size, dtype=np.int64)
+        counts[offsets] = rates['count'].to_numpy()
+        return cls(start, values, counts)
+
+    @property
+    def end(self):
+        return self.start + np.timedelta64(len(self.values) - 1, 'D')
+
+    def _offset(self, dates):
+        days = pd.to_datetime(pd.Index(np.atleast_1d(dates))).to_numpy(dtype='datetime64[D]')
+        return (days - self.start).astype(np.int64)
+
+    def mean(self, start, end):
+        """Promedio de las cotizaciones entre `start` y `end` (inclusive); admite arreglos"""
+        lo = np.clip(self._offset(start), 0, len(self.values))
+        hi = np.clip(self._offset(end) + 1, 0, len(self.values))
+        counts = self._counts[hi] - self._counts[lo]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = (self._sums[hi] - self._sums[lo]) / counts
+        result = np.where(counts > 0, result, np.nan)
+        return result if np.ndim(start) or np.ndim(end) else float(result[0])
+
+    def at(self, dates):
+        """Cotización vigente en cada fecha (última disponible)"""
+        offset = self._offset(dates)
+        inside = (offset >= 0)
+        position = self._last[np.clip(offset, 0, len(self.values) - 1)]
+        result = np.where(inside & (position >= 0), self.values[np.maximum(position, 0)], np.nan)
+        return result if np.ndim(dates) else float(result[0])
+
+    def _aggregate(self, start_freq, end_freq):
+        """Promedio y cierre por período como DataFrame indexado por fin de período"""
+        first = pd.Timestamp(self.start)
+        last = pd.Timestamp(self.end)
+        starts = pd.date_range(first, last, freq=start_freq)
+        if len(starts) == 0 or starts[0] > first:
+            starts = starts.insert(0, first)
+        ends = pd.date_range(first, last, freq=end_freq)
+        if len(ends) == 0 or ends[-1] < last:
+            ends = ends.append(pd.DatetimeIndex([last]))
+        period_ends = ends.to_period(end_freq[0]).to_timestamp(how='end').normalize()
+        return pd.DataFrame(
+            {'promedio': self.mean(starts, ends), 'cierre': self.at(ends)},
+            index=pd.DatetimeIndex(period_ends, name='Fecha')
+        )
+
+    def save(self, path):
+        """Guarda el arreglo diario en npz (los agregados se recalculan al cargar)"""
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, start=self.start, values=self.values, counts=self.counts)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['start'][()], data['values'], data['counts'])
+
+    @classmethod
+    def from_source(cls, input_path):
+        """
+        Store para el libro del BCU; el xlsx se parsea una sola vez y el
+        arreglo queda en el directorio de cache junto a la fuente.
+        """
+        directory, name = os.path.split(os.path.abspath(input_path))
+        cache_path = os.path.join(
+            directory, READ_CACHE_DIRNAME, f"{name}.{source_signature(input_path)}.rates_v{STORE_VERSION}.npz"
+        )
+        if os.path.exists(cache_path):
+            return cls.load(cache_path)
+
+        df = read_file(input_path)
+
+        # Validaciones
+        validate_non_empty(df, "Tipo de cambio")
+        check_required_columns(df, ['Fecha', RATE_COLUMN])
+
+        df['Fecha'] = pd.to_datetime(df['Fecha'], format='%d-%m-%Y')
+        df = df.set_index('Fecha')
+
+        store = cls.from_frame(df)
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        store.save(cache_path)
+        # Arreglos de versiones anteriores del libro (o del formato)
+        prune_cache_entries(cache_path, f"{glob.escape(name)}.*.rates*.npz")
+        return store
+
 def process_exchange_rate(input_path, output_path, years_params):
-    """Procesa tipos de cambio históricos"""
+    """Procesa tipos de cambio históricos
+
+    Las cotizaciones diarias quedan disponibles con
+    `ExchangeRateStore.from_source(input_path)` (cacheado).
+
+    Returns:
+        (tipo de cambio del año base, promedio anual)
+    """
     print("Procesando tipos de cambio...")
-    df = read_file(input_path)
-    
-    # Validaciones
-    validate_non_empty(df, "Tipo de cambio")
-    check_required_columns(df, ['Fecha', 'Dólar.USA.Venta'])
-    
-    # Preparar datos
-    df['Fecha'] = pd.to_datetime(df['Fecha'], format='%d-%m-%Y')
-    df = df.set_index('Fecha')
-    
-    # Calcular promedio anual del tipo de cambio venta
-    tc_annual = resample_annual(df['Dólar.USA.Venta'])
-    
-    # Obtener TC 2020 para normalización
+    store = ExchangeRateStore.from_source(input_path)
+
+    # Promedio anual del tipo de cambio venta
+    tc_annual = store.annual['promedio'].rename(RATE_COLUMN)
+
+    # Obtener TC del año base para normalización
     tc_2020 = tc_annual[tc_annual.index.year == years_params['base_year']].iloc[0]
-    
+
     # Guardar resultados
-    ensure_dir(output_path)
-    tc_annual.to_csv(output_path)
-    
-    return tc_2020, tc_annual
\ No newline at end of file
+    save_with_metadata(tc_annual, output_path, index=True)
+
+    return tc_2020, tc_annual
@@ -1,66 +1,110 @@
 """
 Procesamiento de datos de combustibles
 """
-from ..utils.io import ensure_dir, read_file
+from ..utils.io import read_file, save_with_metadata
 from ..utils.transformations import filter_by_years, normalize_to_base_year
 from ..utils.validations import validate_non_empty, check_required_columns
-import os
-import yaml
+import csv
 import pandas as pd
 
-def process_fuel(input_path, output_path, years_params, ipc_df, tc_2020, fuel_type="nafta"):
-    """Procesa datos de ventas de combustibles en metros cúbicos"""
-    print(f"\nProcesando datos de ventas de {fuel_type}...")
+# Columnas de la fuente que se agregan en un mismo departamento
+FUEL_DEPARTMENT_COLUMNS = {
+    'Canelones balneario': 'Canelones',
+    'Canelones resto': 'Canelones'
+}
+FUEL_TOTAL_COLUMN = 'Total'
+
+def read_fuel_file(input_path):
+    """
+    Lee un archivo de ventas de ANCAP separando el bloque de cabecera
+    (Name, Area, Unit, Frequency, ..., Id) del cuerpo numérico.
+
+    Returns:
+        (DataFrame float64 indexado por fecha, dict de cabecera por serie)
+    """
+    with open(input_path, 'r', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        names = next(reader)[1:]
+        header = {}
+        for row in reader:
+            header[row[0]] = row[1:]
+            if row[0] == 'Id':
+                break
     
-    # Leer el archivo saltando las filas de metadatos
-    df = pd.read_csv(input_path)
-    print(f"Shape del DataFrame original: {df.shape}")
-    print("\nPrimeras filas del archivo original:")
-    print(df.head(10))
+    if 'Id' not in header:
+        raise ValueError(f"No se encontró la fila 'Id' en la cabecera de {input_path}")
     
-    # Extraer las fechas y datos numéricos, saltando las filas de metadata
-    data_df = df.iloc[9:].copy()
-    fechas = pd.to_datetime(data_df.iloc[:, 0])
-    print(f"\nCantidad de fechas extraídas: {len(fechas)}")
-    print(f"Rango de fechas: {fechas.min()} a {fechas.max()}")
+    # El cuerpo se lee directamente como float64 con fechas
+    df = pd.read_csv(
+        input_path,
+        skiprows=range(1, len(header) + 1),
+        index_col=0,
+        parse_dates=True,
+        dtype=dict.fromkeys(names, 'float64')
+    )
+    df.index.name = 'fecha'
     
-    # Limpiar y convertir volúmenes (columna Total)
-    volumenes = pd.to_numeric(data_df['Total'].str.strip().str.replace(',', '.'), errors='coerce')
+    series = {
+        name: {
+            key.lower().replace(' ', '_'): values[i]
+            for key, values in header.items()
+            if values[i] not in ('', 'nan')
+        }
+        for i, name in enumerate(names)
+    }
+    return df, series
+
+def build_fuel_panel(df):
+    """
+    Panel largo (departamento, fecha) con volúmenes mensuales y anuales.
+    Las columnas de un mismo departamento se suman y se excluye el total.
+    """
+    departments = df.drop(columns=FUEL_TOTAL_COLUMN)
+    departments = departments.T.groupby(
+        departments.columns.map(lambda c: FUEL_DEPARTMENT_COLUMNS.get(c, c)),
+        sort=False
+    ).sum(min_count=1).T
     
-    print("\nPrimeras filas de volúmenes:")
-    print(volumenes.head())
-    print("\nEstadísticas de volúmenes:")
-    print(volumenes.describe())
+    panels = {
+        'mensual': departments,
+        'anual': departments.resample('YE').sum(min_count=1)
+    }
+    panel = pd.concat(
+        {
+            frequency: wide.rename_axis(columns='departamento').stack().rename('volumen')
+            for frequency, wide in panels.items()
+        },
+        names=['frecuencia']
+    ).reset_index()
+    return panel[['departamento', 'frecuencia', 'fecha', 'volumen']]
+
+def process_fuel(input_path, output_path, years_params, ipc_df, tc_2020, fuel_type="nafta", panel_path=None):
+    """Procesa datos de ventas de combustibles en metros cúbicos
+
+    Además del total anual guarda en `panel_path` (si se indica) el panel
+    por departamento con frecuencia mensual y anual.
+    """
+    print(f"\nProcesando datos de ventas de {fuel_type}...")
     
-    # Crear DataFrame final con fecha
-    df_final = pd.DataFrame({
-        'fecha': fechas,
-        'volumen': volumenes,
-        'year': fechas.dt.year
-    })
+    df, series = read_fuel_file(input_path)
+    print(f"Shape del cuerpo: {df.shape}")
+    print(f"Rango de fechas: {df.index.min()} a {df.index.max()}")
     
-    # Agrupar por año y calcular promedio, manteniendo la fecha
-    df_anual = df_final.groupby('year').agg({
-        'volumen': 'sum',  # Cambiamos a suma para obtener el total anual
-        'fecha': 'last'  # Tomamos la última fecha de cada año
-    }).reset_index()
+    # Filtrar años según configuración
+    df = df[(df.index.year >= years_params['start']) & (df.index.year <= years_params['end'])]
     
+    # Total anual, manteniendo la última fecha de cada año
+    fechas = df.index.to_series()
+    df_anual = pd.DataFrame({
+        'volumen': df[FUEL_TOTAL_COLUMN].groupby(fechas.dt.year).sum(),
+        'fecha': fechas.groupby(fechas.dt.year).last()
+    }).rename_axis('year').reset_index()
     df_anual['year'] = df_anual['year'].astype(int)
     
-    # Filtrar años según configuración
-    df_anual = df_anual[
-        (df_anual['year'] >= years_params['start']) & 
-        (df_anual['year'] <= years_params['end'])
-    ]
-    
     print("\nVolúmenes anuales:")
     print(df_anual)
     
-    # Guardar resultados
-    ensure_dir(os.path.dirname(output_path))
-    df_anual.to_csv(output_path, index=False)
-    
-    # Guardar metadata en YAML
+    # Metadata del dataset
     metadata = {
         'dataset': {
             'name': f'Ventas de {fuel_type}',
@@ -75,20 +119,36 @@ def process_fuel(input_path, output_path, years_params, ipc_df, tc_2020, fuel_ty
                 'Volúmenes mensuales agregados a nivel anual',
                 'Incluye ventas totales en el mercado interno',
                 'Datos en metros cúbicos'
-            ]
+            ],
+            'series': series
         }
     }
     
-    metadata_path = os.path.join(os.path.dirname(output_path), 'metadata.yaml')
-    with open(metadata_path, 'w', encoding='utf-8') as f:
-        yaml.dump(metadata, f, allow_unicode=True, sort_keys=False)
+    # Guardar resultados con metadata embebida
+    save_with_metadata(df_anual, output_path, metadata)
+    
+    if panel_path is not None:
+        panel = build_fuel_panel(df)
+        panel_metadata = {
+            'dataset': {
+                **metadata['dataset'],
+                'name': f'Ventas de {fuel_type} por departamento',
+                'frequency': ['mensual', 'anual'],
+                'notas': [
+                    'Panel largo (departamento, frecuencia, fecha)',
+                    'Canelones suma las series balneario y resto',
+                    'Datos en metros cúbicos'
+                ]
+            }
+        }
+        save_with_metadata(panel, panel_path, panel_metadata)
     
     return df_anual, metadata
 
-def process_gasoline(input_path, output_path, years_params, ipc_df, tc_2020):
+def process_gasoline(input_path, output_path, years_params, ipc_df, tc_2020, panel_path=None):
     """Procesa datos de ventas de nafta en metros cúbicos"""
-    return process_fuel(input_path, output_path, years_params, ipc_df, tc_2020, "nafta")
+    return process_fuel(input_path, output_path, years_params, ipc_df, tc_2020, "nafta", panel_path)
 
-def process_diesel(input_path, output_path, years_params, ipc_df, tc_2020):
+def process_diesel(input_path, output_path, years_params, ipc_df, tc_2020, panel_path=None):
     """Procesa datos de ventas de gasoil en metros cúbicos"""
-    return process_fuel(input_path, output_path, years_params, ipc_df, tc_2020, "gasoil") 
\ No newline at end of file
+    return process_fuel(input_path, output_path, years_params, ipc_df, tc_2020, "gasoil", panel_path)
@@ -1,17 +1,109 @@
 """
 Procesamiento de datos geográficos
 """
+import json
 import os
-import geopandas as gpd
-import matplotlib.pyplot as plt
-from ..utils.io import ensure_dir
+import pickle
+import numpy as np
+from ..utils.io import ensure_dir, csv_export_enabled, source_signature
+
+# geopandas y matplotlib se importan dentro de cada función: son las
+# dependencias más pesadas y solo las necesitan las etapas geográficas
+
+# Niveles de resolución: tolerancia de simplificación en metros (CRS proyectado)
+GEOMETRY_LEVELS = {'full': 0, 'medium': 50, 'coarse': 500}
+GEOMETRY_MANIFEST = 'geometry_cache.json'
+# El shapefile del INE no trae .prj; su README declara UTM 21S
+SOURCE_CRS = 'EPSG:32721'
+# Polígonos del shapefile que no son departamentos del panel (claves
+# normalizadas): el área en litigio con Brasil no tiene datos, no cuenta
+# como vecino ni se asigna a puntos
+EXCLUDED_AREAS = ('limite contestado',)
+
+def geometry_path(output_dir, level='full'):
+    """Ruta del GeoParquet de un nivel de resolución"""
+    if level not in GEOMETRY_LEVELS:
+        raise ValueError(f"Nivel desconocido: {level}. Opciones: {list(GEOMETRY_LEVELS)}")
+    suffix = '' if level == 'full' else f'_{level}'
+    return os.path.join(output_dir, f"uruguay_map{suffix}.parquet")
+
+def pick_level(max_error=0):
+    """Nivel más liviano cuya tolerancia no supera `max_error` (metros)"""
+    candidates = [level for level, tolerance in GEOMETRY_LEVELS.items() if tolerance <= max_error]
+    return max(candidates, key=GEOMETRY_LEVELS.get)
+
+def read_departments(output_dir, level=None, columns=None, max_error=0):
+    """
+    Lee las geometrías departamentales desde GeoParquet (vía Arrow).
+
+    Args:
+        output_dir: Directorio de salida de `process_shapefile`
+        level: 'full', 'medium' o 'coarse'; si es None se elige con `max_error`
+        columns: Columnas a leer (la geometría se incluye siempre)
+        max_error: Error de simplificación aceptable en metros
+    """
+    import geopandas as gpd
+
+    if columns is not None and 'geometry' not in columns:
+        columns = list(columns) + ['geometry']
+    return gpd.read_parquet(geometry_path(output_dir, level or pick_level(max_error)), columns=columns)
+
+def simplify_levels(gdf):
+    """
+    Simplificaciones por nivel que preservan la topología compartida
+    entre departamentos (sin huecos ni solapamientos en los bordes).
+    Las tolerancias están en metros, así que `gdf` debe tener un CRS
+    proyectado.
+    """
+    if gdf.crs is None or not gdf.crs.is_projected:
+        raise ValueError(f"Se requiere un CRS proyectado en metros para simplificar (CRS: {gdf.crs})")
+    levels = {}
+    for level, tolerance in GEOMETRY_LEVELS.items():
+        if tolerance == 0:
+            levels[level] = gdf
+            continue
+        simplified = gdf.copy()
+        if hasattr(gdf.geometry, 'simplify_coverage'):
+            simplified.geometry = gdf.geometry.simplify_coverage(tolerance)
+        else:
+            # geopandas < 1.1: topología válida por polígono
+            simplified.geometry = gdf.geometry.simplify(tolerance, preserve_topology=True)
+        levels[level] = simplified
+    return levels
+
+def _source_files(input_dir, shp_file):
+    stem = os.path.splitext(shp_file)[0]
+    return sorted(
+        os.path.join(input_dir, f) for f in os.listdir(input_dir)
+        if os.path.splitext(f)[0] == stem
+    )
+
+def _cached_signature(output_dir):
+    manifest_path = os.path.join(output_dir, GEOMETRY_MANIFEST)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if not all(os.path.exists(geometry_path(output_dir, level)) for level in GEOMETRY_LEVELS):
+        return None
+    # Caches previos sin CRS asignado o con otras tolerancias se reconstruyen
+    if manifest.get('crs') is None or manifest.get('levels') != GEOMETRY_LEVELS:
+        return None
+    return manifest.get('source')
 
 def process_shapefile(input_dir, output_dir):
-    """Procesa y convierte shapefiles"""
+    """
+    Procesa el shapefile de departamentos y cachea sus resoluciones en
+    GeoParquet. Si el shapefile no declara CRS se asume `SOURCE_CRS`.
+
+    El shapefile y el GeoJSON de salida son formatos de exportación y,
+    como los CSV, solo se escriben si `csv_export_enabled()`; el mapa PNG
+    se genera siempre.
+    """
     print("Cargando shapefile...")
     
     # Buscar el primer archivo .shp en el directorio
-    shp_files = [f for f in os.listdir(input_dir) if f.endswith('.shp')]
+    shp_files = sorted(f for f in os.listdir(input_dir) if f.endswith('.shp'))
     if not shp_files:
         raise FileNotFoundError(f"No se encontraron archivos .shp en {input_dir}")
     
@@ -19,7 +111,18 @@ def process_shapefile(input_dir, output_dir):
     shp_file = shp_files[0]
     print(f"Usando shapefile: {shp_file}")
     
-    gdf = gpd.read_file(os.path.join(input_dir, shp_file))
+    # Si el shapefile no cambió se reutilizan los GeoParquet existentes
+    signature = {os.path.basename(f): source_signature(f) for f in _source_files(input_dir, shp_file)}
+    if _cached_signature(output_dir) == signature:
+        print("✓ Geometrías sin cambios, usando GeoParquet en cache")
+        return read_departments(output_dir, 'full')
+    
+    import geopandas as gpd
+
+    # Solo se leen el nombre y la geometría
+    gdf = gpd.read_file(os.path.join(input_dir, shp_file), columns=['NOMBRE'])
+    if gdf.crs is None:
+        gdf = gdf.set_crs(SOURCE_CRS)
     
     # Simplificar y estandarizar usando los nombres correctos de columnas
     gdf = gdf[['NOMBRE', 'geometry']].rename(columns={'NOMBRE': 'departamento'})
@@ -28,26 +131,23 @@ def process_shapefile(input_dir, output_dir):
     # Crear directorio de salida completo (no solo el padre)
     os.makedirs(output_dir, exist_ok=True)
     
-    # Guardar en múltiples formatos
-    # Shapefile
-    shp_output = os.path.join(output_dir, "uruguay_map.shp")
-    gdf.to_file(shp_output)
+    # GeoParquet por nivel de resolución
+    levels = simplify_levels(gdf)
+    for level, level_gdf in levels.items():
+        level_gdf.to_parquet(geometry_path(output_dir, level))
     
-    # GeoJSON
-    geojson_output = os.path.join(output_dir, "uruguay_map.geojson")
-    gdf.to_file(geojson_output, driver='GeoJSON')
+    # Formatos de texto, solo si la exportación está activa
+    if csv_export_enabled():
+        save_geo_files(gdf, output_dir, plot_gdf=levels['medium'])
+    else:
+        generate_map_plot(levels['medium'], os.path.join(output_dir, "mapa_departamentos.png"))
     
-    # Visualización
-    plt.figure(figsize=(10, 12))
-    gdf.plot(edgecolor='black', facecolor='lightgrey')
-    plt.title("Departamentos de Uruguay")
-    plt.axis("off")
-    plt.savefig(os.path.join(output_dir, "mapa_departamentos.png"), dpi=300, bbox_inches='tight')
-    plt.close()
+    with open(os.path.join(output_dir, GEOMETRY_MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump({'source': signature, 'crs': gdf.crs.to_string(), 'levels': GEOMETRY_LEVELS}, f, indent=2)
     
     return gdf
 
-def save_geo_files(gdf, output_dir):
+def save_geo_files(gdf, output_dir, plot_gdf=None):
     """Guarda en diferentes formatos geoespaciales"""
     # Shapefile
     shp_path = os.path.join(output_dir, "uruguay_map.shp")
@@ -59,13 +159,265 @@ def save_geo_files(gdf, output_dir):
     
     # Visualización
     plot_path = os.path.join(output_dir, "mapa_departamentos.png")
-    generate_map_plot(gdf, plot_path)
+    generate_map_plot(gdf if plot_gdf is None else plot_gdf, plot_path)
 
 def generate_map_plot(gdf, output_path):
     """Genera visualización del mapa"""
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(10, 12))
     gdf.plot(edgecolor='black', facecolor='lightgrey')
     plt.title("Departamentos de Uruguay")
     plt.axis("off")
     plt.savefig(output_path, dpi=300, bbox_inches='tight')
-    plt.close() 
\ No newline at end of file
+    plt.close()
+
+# ---------------------------------------------------------------------------
+# Coropletas en lote: los polígonos se convierten una vez a trayectorias de
+# matplotlib y cada cuadro solo cambia los colores de relleno
+# ---------------------------------------------------------------------------
+
+def department_paths(gdf):
+    """Trayectorias (con huecos) de cada departamento, en el orden de `gdf`"""
+    from matplotlib.path import Path as MplPath
+
+    def rings(polygon):
+        return [MplPath(ring.coords[:], closed=True) for ring in (polygon.exterior, *polygon.interiors)]
+
+    paths = []
+    for geometry in gdf.geometry:
+        polygons = getattr(geometry, 'geoms', [geometry])
+        paths.append(MplPath.make_compound_path(*[r for p in polygons for r in rings(p)]))
+    return paths
+
+# Estado de cada proceso de dibujo (figura creada una sola vez)
+_renderer = {}
+
+def _init_renderer(paths, bounds, cmap, vmin, vmax, figsize, dpi, label):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import PathCollection
+    from matplotlib.colors import Normalize
+
+    fig, ax = plt.subplots(figsize=figsize, dpi=dpi)
+    collection = PathCollection(paths, edgecolor='black', linewidth=0.3)
+    ax.add_collection(collection)
+    ax.set_xlim(bounds[0], bounds[2])
+    ax.set_ylim(bounds[1], bounds[3])
+    ax.set_aspect('equal')
+    ax.axis('off')
+
+    norm = Normalize(vmin=vmin, vmax=vmax)
+    colormap = matplotlib.colormaps[cmap]
+    fig.colorbar(matplotlib.cm.ScalarMappable(norm=norm, cmap=colormap), ax=ax, shrink=0.6, label=label)
+    _renderer.update(fig=fig, ax=ax, collection=collection, norm=norm, cmap=colormap)
+
+def _render_frame(task):
+    """Dibuja un cuadro cambiando solo colores y título"""
+    values, title, output_path = task
+    colors = _renderer['cmap'](_renderer['norm'](values))
+    colors[np.isnan(values)] = (0.85, 0.85, 0.85, 1.0)
+    _renderer['collection'].set_facecolors(colors)
+    _renderer['ax'].set_title(title)
+    _renderer['fig'].savefig(output_path)
+    return output_path
+
+def render_choropleths(gdf, frames, output_dir, prefix='frame', cmap='viridis',
+                       label='', figsize=(6, 7), dpi=100, max_workers=None,
+                       gif_path=None, frame_duration=500):
+    """
+    Renderiza un mapa coroplético por columna de `frames`.
+
+    Args:
+        gdf: Geometrías con columna 'departamento' (idealmente nivel 'medium')
+        frames: DataFrame departamentos × cuadros (p.ej. años); los
+            nombres se emparejan sin tildes ni mayúsculas
+        output_dir: Directorio de las imágenes PNG
+        prefix: Prefijo del nombre de cada imagen
+        cmap, label: Paleta y etiqueta de la barra de colores (escala común)
+        max_workers: Procesos de dibujo (None = según CPUs)
+        gif_path: Si se indica, arma también un GIF animado
+        frame_duration: Duración de cada cuadro del GIF en ms
+
+    Returns:
+        Lista de rutas de las imágenes en el orden de las columnas
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    from ..panel.inputs import normalize_text
+
+    # Alinear las filas de `frames` al orden de las geometrías
+    keys = frames.index.map(normalize_text)
+    values = frames.set_axis(keys).reindex(gdf['departamento'].map(normalize_text))
+    matrix = values.to_numpy(dtype=np.float64)
+
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [
+        (matrix[:, i], str(column), os.path.join(output_dir, f"{prefix}_{column}.png"))
+        for i, column in enumerate(frames.columns)
+    ]
+    init_args = (
+        department_paths(gdf), tuple(gdf.total_bounds), cmap,
+        np.nanmin(matrix), np.nanmax(matrix), figsize, dpi, label
+    )
+
+    # 'spawn': la función suele correr dentro de un hilo del pipeline y un
+    # fork desde un proceso con varios hilos puede heredar locks tomados
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context,
+                             initializer=_init_renderer, initargs=init_args) as pool:
+        images = list(pool.map(_render_frame, tasks, chunksize=max(1, len(tasks) // (4 * (os.cpu_count() or 1)))))
+
+    if gif_path is not None:
+        from contextlib import ExitStack
+        from PIL import Image
+
+        with ExitStack() as stack:
+            first, *rest = [stack.enter_context(Image.open(path)) for path in images]
+            first.save(gif_path, save_all=True, append_images=rest, duration=frame_duration, loop=0)
+    return images
+
+def render_vehicle_tax_maps(vehicle_tax, geo_dir, output_dir, max_workers=None):
+    """Coropletas anuales de la recaudación de patentes y su animación"""
+    from ..utils.io import load_input
+
+    df = load_input(vehicle_tax).set_index('DEPARTAMENTO')
+    gdf = read_departments(geo_dir, 'medium', columns=['departamento'])
+    images = render_choropleths(
+        gdf, df, output_dir,
+        prefix='patentes', cmap='viridis', label='USD constantes',
+        max_workers=max_workers,
+        gif_path=os.path.join(output_dir, 'patentes.gif')
+    )
+    print(f"✓ {len(images)} mapas guardados en: {output_dir}")
+    return images
+
+# ---------------------------------------------------------------------------
+# Asignación masiva de puntos a departamentos
+# ---------------------------------------------------------------------------
+
+class DepartmentLocator:
+    """
+    Asigna puntos a departamentos con un STRtree sobre los polígonos
+    procesados y predicados vectorizados de shapely 2. Los nombres
+    devueltos son las claves normalizadas de `src.panel` (sin tildes,
+    en minúsculas). Los polígonos de `EXCLUDED_AREAS` no se indexan:
+    sus puntos quedan en None, como los que caen fuera de todos.
+
+    El índice (geometrías en WKB y claves) se cachea junto al GeoParquet
+    y se reconstruye solo si éste cambia.
+
+    Args:
+        geo_dir: Directorio de salida de `process_shapefile`
+        level: Nivel de resolución a usar ('full' para bordes exactos)
+    """
+
+    INDEX_FILE = 'department_index_{level}.pkl'
+
+    def __init__(self, geo_dir, level='full'):
+        import shapely
+
+        source = geometry_path(geo_dir, level)
+        index_path = os.path.join(geo_dir, self.INDEX_FILE.format(level=level))
+        signature = source_signature(source)
+
+        payload = None
+        if os.path.exists(index_path):
+            with open(index_path, 'rb') as f:
+                payload = pickle.load(f)
+            if payload.get('signature') != signature or payload.get('excluded') != list(EXCLUDED_AREAS):
+                payload = None
+
+        if payload is None:
+            from ..panel.inputs import normalize_text
+
+            gdf = read_departments(geo_dir, level, columns=['departamento'])
+            keys = gdf['departamento'].map(normalize_text)
+            gdf = gdf[~keys.isin(EXCLUDED_AREAS)]
+            payload = {
+                'signature': signature,
+                'excluded': list(EXCLUDED_AREAS),
+                'crs': gdf.crs.to_wkt() if gdf.crs is not None else None,
+                'keys': keys[gdf.index].tolist(),
+                'wkb': shapely.to_wkb(gdf.geometry.values)
+            }
+            tmp_path = f"{index_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(payload, f)
+            os.replace(tmp_path, index_path)
+
+        self.crs = payload['crs']
+        self.keys = np.array(payload['keys'], dtype=object)
+        self.geometries = shapely.from_wkb(payload['wkb'])
+        shapely.prepare(self.geometries)
+        self.tree = shapely.STRtree(self.geometries)
+
+    def _transformer(self, crs):
+        if crs is None:
+            return None
+        if self.crs is None:
+            raise ValueError(
+                f"No se puede transformar desde {crs}: los polígonos no tienen CRS "
+                "(reprocesar el shapefile con `process_shapefile`)"
+            )
+        from pyproj import CRS, Transformer
+
+        if CRS.from_user_input(crs) == CRS.from_wkt(self.crs):
+            return None
+        return Transformer.from_crs(crs, CRS.from_wkt(self.crs), always_xy=True)
+
+    def locate(self, x, y, crs=None) -> np.ndarray:
+        """
+        Departamento de cada punto (None si cae fuera de todos).
+
+        Args:
+            x, y: Coordenadas (arreglos de igual largo)
+            crs: CRS de las coordenadas (p.ej. 'EPSG:4326'); None si ya
+                están en el CRS de los polígonos
+
+        Raises:
+            ValueError: Si se indica `crs` y los polígonos no tienen CRS
+        """
+        import shapely
+
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        transformer = self._transformer(crs)
+        if transformer is not None:
+            x, y = transformer.transform(x, y)
+
+        points = shapely.points(x, y)
+        point_idx, dept_idx = self.tree.query(points, predicate='intersects')
+
+        result = np.full(len(points), None, dtype=object)
+        # En bordes compartidos gana el primer departamento encontrado
+        first = np.unique(point_idx, return_index=True)[1]
+        result[point_idx[first]] = self.keys[dept_idx[first]]
+        return result
+
+    def locate_frame(self, df, x_col, y_col, crs=None, out_col='departamento'):
+        """Copia de `df` con la columna de departamento agregada"""
+        df = df.copy()
+        df[out_col] = self.locate(df[x_col].to_numpy(), df[y_col].to_numpy(), crs)
+        return df
+
+    def locate_chunks(self, chunks, x_col, y_col, crs=None, out_col='departamento'):
+        """Procesa un flujo de DataFrames (p.ej. `pd.read_csv(chunksize=...)`)"""
+        for chunk in chunks:
+            yield self.locate_frame(chunk, x_col, y_col, crs, out_col)
+
+    def locate_file(self, input_path, output_path, x_col, y_col, crs=None,
+                    out_col='departamento', chunksize=500_000):
+        """Asigna departamentos a un CSV por bloques, sin cargarlo entero"""
+        import pandas as pd
+
+        ensure_dir(output_path)
+        rows, unmatched = 0, 0
+        chunks = pd.read_csv(input_path, chunksize=chunksize)
+        for i, chunk in enumerate(self.locate_chunks(chunks, x_col, y_col, crs, out_col)):
+            chunk.to_csv(output_path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+            rows += len(chunk)
+            unmatched += int(chunk[out_col].isna().sum())
+        print(f"✓ {rows} puntos asignados ({unmatched} fuera de los departamentos)")
+        return output_path
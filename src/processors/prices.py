@@ -2,8 +2,9 @@
 Procesamiento de índices de precios
 """
 import pandas as pd
-from ..utils.io import ensure_dir, read_file
+from ..utils.io import read_file, save_with_metadata
 from ..utils.transformations import resample_annual, normalize_to_base_year
+from ..utils.conversion import RealValueCube
 
 def process_cpi(input_path, output_path, years_params):
     """Procesa el IPC"""
@@ -22,6 +23,21 @@ def process_cpi(input_path, output_path, years_params):
     # Renombrar el índice antes de guardar
     cpi_annual.index.name = 'ano'  # Aseguramos que use 'ano' sin tilde
     
-    ensure_dir(output_path)
-    cpi_annual.to_csv(output_path)
-    return cpi_annual 
\ No newline at end of file
+    save_with_metadata(cpi_annual, output_path, index=True)
+    return cpi_annual
+
+def build_real_value_cube(cpi, gdp_deflator, exchange_rate, output_path):
+    """
+    Precalcula el cubo de factores (año, año base, deflactor, moneda)
+
+    Args:
+        cpi: IPC anual publicado por `process_cpi`
+        gdp_deflator: Deflactor de EE.UU. de `economic.process_gdp_deflator`
+        exchange_rate: Tipo de cambio anual de `exchange_rates.process_exchange_rate`
+        output_path: Ruta del archivo npz
+    """
+    gdpdef = gdp_deflator.set_index(pd.to_datetime(gdp_deflator['observation_date']))['GDPDEF']
+    cube = RealValueCube(cpi, resample_annual(gdpdef), exchange_rate)
+    cube.save(output_path)
+    print(f"Cubo de conversión {cube.cube.shape} guardado en: {output_path}")
+    return cube
@@ -0,0 +1,213 @@
+"""
+Matrices espaciales entre departamentos (contigüidad y distancias)
+"""
+import hashlib
+import os
+import numpy as np
+from .geo import EXCLUDED_AREAS, geometry_path, read_departments
+
+# scipy, shapely y pandas se importan dentro de cada función para no
+# cargarlos al importar el módulo
+
+class SpatialWeights:
+    """
+    Contigüidad queen/rook (CSR) y distancias entre centroides (km,
+    float32) con departamentos ordenados por su clave normalizada, igual
+    que el panel (`src.panel` ordena por 'departamento').
+
+    Un rezago espacial de cualquier variable en todos los años es un
+    único producto W @ X con X de departamentos × (años · variables).
+    """
+
+    def __init__(self, keys, queen, rook, distances, centroids):
+        self.keys = np.asarray(keys, dtype=object)
+        self.queen = queen
+        self.rook = rook
+        self.distances = np.asarray(distances, dtype=np.float32)
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def matrix(self, kind='queen', standardize=True):
+        """
+        Matriz de pesos en CSR.
+
+        Args:
+            kind: 'queen', 'rook' o 'distance' (inversa de la distancia)
+            standardize: Normalizar las filas a suma 1
+        """
+        from scipy import sparse
+
+        if kind == 'distance':
+            with np.errstate(divide='ignore'):
+                inverse = np.where(self.distances > 0, 1 / self.distances, 0).astype(np.float32)
+            weights = sparse.csr_matrix(inverse)
+        elif kind in ('queen', 'rook'):
+            weights = getattr(self, kind)
+        else:
+            raise ValueError(f"Tipo de matriz desconocido: {kind}")
+
+        if standardize:
+            sums = np.asarray(weights.sum(axis=1)).ravel()
+            scale = np.divide(1, sums, out=np.zeros_like(sums), where=sums > 0)
+            weights = sparse.diags(scale.astype(np.float32)) @ weights
+        return weights.tocsr()
+
+    def reorder(self, keys):
+        """Pesos reordenados según `keys` (claves normalizadas)"""
+        from scipy import sparse
+
+        position = {key: i for i, key in enumerate(self.keys)}
+        missing = [key for key in keys if key not in position]
+        if missing:
+            raise ValueError(f"Departamentos sin geometría: {missing}")
+        order = np.array([position[key] for key in keys])
+
+        def select(matrix):
+            return sparse.csr_matrix(matrix[order][:, order])
+
+        return SpatialWeights(
+            keys, select(self.queen), select(self.rook),
+            self.distances[np.ix_(order, order)], self.centroids[order]
+        )
+
+    def lag(self, wide, kind='queen', standardize=True):
+        """
+        Rezago espacial de un DataFrame ancho departamentos × columnas
+        (p.ej. años); el índice son claves normalizadas.
+
+        Los vecinos sin dato (NaN) no cuentan: con filas estandarizadas
+        el promedio se renormaliza sobre los vecinos observados. Sin
+        ningún vecino observado el rezago es NaN.
+        """
+        import pandas as pd
+
+        values = wide.reindex(self.keys).to_numpy(dtype=np.float64)
+        observed = ~np.isnan(values)
+        weights = self.matrix(kind, standardize)
+        sums = weights @ np.where(observed, values, 0.0)
+        coverage = weights @ observed.astype(np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            lagged = sums / coverage if standardize else sums
+        lagged = np.where(coverage > 0, lagged, np.nan)
+        return pd.DataFrame(lagged, index=pd.Index(self.keys, name=wide.index.name), columns=wide.columns)
+
+    def lag_panel(self, panel, value_cols, dept_col='departamento', year_col='año',
+                  kind='queen', standardize=True):
+        """Agrega columnas `w_<variable>` a un panel largo con un solo producto disperso"""
+        wide = panel.pivot(index=dept_col, columns=year_col, values=list(value_cols))
+        lagged = self.lag(wide, kind, standardize)
+        long = lagged.stack(level=year_col, future_stack=True).dropna(how='all').add_prefix('w_')
+        return panel.merge(long, left_on=[dept_col, year_col], right_index=True, how='left')
+
+    def save(self, path):
+        """Guarda las matrices en un npz (CSR como data/indices/indptr)"""
+        arrays = {'keys': self.keys.astype(str), 'distances': self.distances, 'centroids': self.centroids}
+        for name in ('queen', 'rook'):
+            matrix = getattr(self, name)
+            arrays.update({
+                f'{name}_data': matrix.data,
+                f'{name}_indices': matrix.indices,
+                f'{name}_indptr': matrix.indptr
+            })
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Carga matrices guardadas con `save`"""
+        from scipy import sparse
+
+        with np.load(path, allow_pickle=False) as data:
+            n = len(data['keys'])
+
+            def csr(name):
+                return sparse.csr_matrix(
+                    (data[f'{name}_data'], data[f'{name}_indices'], data[f'{name}_indptr']), shape=(n, n)
+                )
+
+            return cls(data['keys'].tolist(), csr('queen'), csr('rook'), data['distances'], data['centroids'])
+
+def contiguity(geometries, tolerance=1.0, min_shared_length=100.0):
+    """
+    Pares contiguos de un arreglo de polígonos.
+
+    Args:
+        geometries: Polígonos en un CRS proyectado (metros)
+        tolerance: Distancia máxima para considerar que dos bordes se tocan
+        min_shared_length: Largo mínimo de borde compartido para 'rook'
+
+    Returns:
+        (queen, rook) como matrices CSR binarias float32
+    """
+    import shapely
+    from scipy import sparse
+
+    n = len(geometries)
+    tree = shapely.STRtree(geometries)
+    left, right = tree.query(geometries, predicate='dwithin', distance=tolerance)
+    keep = left != right
+    left, right = left[keep], right[keep]
+
+    # Largo del borde de j dentro de la franja de tolerancia alrededor de i
+    shared = shapely.length(shapely.intersection(
+        shapely.boundary(geometries[right]),
+        shapely.buffer(geometries[left], tolerance)
+    ))
+    rook_pairs = shared >= min_shared_length
+
+    def ones(count):
+        return np.ones(count, dtype=np.float32)
+
+    queen = sparse.csr_matrix((ones(len(left)), (left, right)), shape=(n, n))
+    rook = sparse.csr_matrix((ones(rook_pairs.sum()), (left[rook_pairs], right[rook_pairs])), shape=(n, n))
+    # Simetría ante diferencias numéricas en los bordes
+    return queen.maximum(queen.T).tocsr(), rook.maximum(rook.T).tocsr()
+
+def centroid_distances(geometries):
+    """Centroides (metros) y matriz de distancias entre ellos (km, float32)"""
+    import shapely
+
+    centroids = shapely.get_coordinates(shapely.centroid(geometries))
+    diff = centroids[:, None, :] - centroids[None, :, :]
+    distances = np.sqrt((diff ** 2).sum(axis=-1)) / 1000
+    return centroids.astype(np.float32), distances.astype(np.float32)
+
+def build_spatial_weights(geo_dir, level='full', tolerance=1.0, min_shared_length=100.0):
+    """
+    Deriva (o lee del cache) las matrices espaciales de los departamentos.
+
+    La clave del cache es el hash del contenido del GeoParquet más los
+    parámetros; el npz se guarda junto a las geometrías. Los polígonos de
+    `EXCLUDED_AREAS` se descartan antes de calcular vecinos.
+    """
+    from ..panel.inputs import normalize_text
+
+    source = geometry_path(geo_dir, level)
+    digest = hashlib.sha256()
+    with open(source, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    digest.update(f"{tolerance}:{min_shared_length}:{','.join(EXCLUDED_AREAS)}".encode())
+    cache_path = os.path.join(geo_dir, f"spatial_weights_{digest.hexdigest()[:16]}.npz")
+
+    if os.path.exists(cache_path):
+        print(f"✓ Matrices espaciales en cache: {cache_path}")
+        return SpatialWeights.load(cache_path)
+
+    gdf = read_departments(geo_dir, level, columns=['departamento'])
+    gdf = gdf[~gdf['departamento'].map(normalize_text).isin(EXCLUDED_AREAS)]
+    keys = [normalize_text(name) for name in gdf['departamento']]
+    order = np.argsort(keys, kind='stable')
+    geometries = gdf.geometry.values[order]
+
+    queen, rook = contiguity(np.asarray(geometries), tolerance, min_shared_length)
+    centroids, distances = centroid_distances(np.asarray(geometries))
+    weights = SpatialWeights([keys[i] for i in order], queen, rook, distances, centroids)
+    weights.save(cache_path)
+
+    print(f"✓ Matrices espaciales guardadas en: {cache_path}")
+    print(f"  Vecinos queen por departamento: {np.asarray(queen.sum(axis=1)).ravel().astype(int).tolist()}")
+    return weights
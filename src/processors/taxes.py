@@ -1,22 +1,198 @@
 """
 Procesamiento de datos tributarios (patentes vehiculares)
 """
+import numpy as np
 import pandas as pd
-from ..utils.io import ensure_dir, read_file
-from ..utils.transformations import normalize_to_base_year
+from ..utils.io import (
+    read_file, load_input, save_with_metadata,
+    read_chunks, source_signature, prune_cache_entries, READ_CACHE_DIRNAME
+)
+from ..utils.transformations import normalize_to_base_year, splice_panels
+from ..utils.conversion import ConstantUSDConverter
+import glob
 import os
-import yaml
 
-def process_vehicle_tax(input_path, ipc_path, output_path, years_params, exchange_rate):
-    """Procesa datos de patentes vehiculares"""
+# Columnas del libro de ingresos que entran al cubo
+INCOME_COLUMNS = ['AÑO', 'DEPARTAMENTO', 'OBJETO', 'RUBRO', 'RECAUDADO']
+VEHICLE_TAX_LINE = ('Sobre Vehiculos', 'Patente de Rodados')
+# Filas por bloque en la agregación por bloques si no se indica otra cosa
+DEFAULT_CHUNKSIZE = 1_000_000
+
+class IncomeCube:
+    """
+    Recaudación departamental agregada en un cubo
+    (objeto/rubro, departamento, año) a partir de una sola lectura del
+    libro de ingresos. Departamentos y rubros se codifican como
+    categorías y la suma se hace en un único `bincount`; consultar un
+    rubro es una búsqueda en un diccionario y una vista del arreglo.
+
+    Args:
+        lines: Pares (OBJETO, RUBRO) del primer eje
+        departments: Departamentos del segundo eje
+        years: Años del tercer eje
+        values: Recaudación sumada, forma (rubros, departamentos, años)
+        counts: Cantidad de registros por celda (0 = sin dato)
+    """
+
+    def __init__(self, lines, departments, years, values, counts):
+        self.lines = [tuple(line) for line in lines]
+        self.departments = np.asarray(departments, dtype=object)
+        self.years = np.asarray(years, dtype=np.int64)
+        self.values = values
+        self.counts = counts
+        self._line_index = {line: i for i, line in enumerate(self.lines)}
+
+    @classmethod
+    def from_frame(cls, df):
+        """Codifica y agrega la tabla de ingresos"""
+        df = df.assign(**{'AÑO': pd.to_numeric(df['AÑO'], errors='coerce')})
+        df = df[df['RECAUDADO'].notna() & df['AÑO'].notna() & df['DEPARTAMENTO'].notna()]
+
+        dept = pd.Categorical(df['DEPARTAMENTO'])
+        line_codes, lines = pd.MultiIndex.from_arrays(
+            [df['OBJETO'].fillna(''), df['RUBRO'].fillna('')]
+        ).factorize(sort=True)
+        years = df['AÑO'].to_numpy(dtype=np.int64)
+        first_year = years.min()
+        year_codes = years - first_year
+
+        shape = (len(lines), len(dept.categories), int(years.max() - first_year) + 1)
+        flat = np.ravel_multi_index((line_codes, dept.codes, year_codes), shape)
+        size = int(np.prod(shape))
+        values = np.bincount(flat, weights=df['RECAUDADO'].to_numpy(dtype=np.float64), minlength=size)
+        counts = np.bincount(flat, minlength=size)
+
+        return cls(
+            lines.tolist(), dept.categories.to_numpy(), np.arange(first_year, first_year + shape[2]),
+            values.reshape(shape), counts.reshape(shape).astype(np.int32)
+        )
+
+    @classmethod
+    def from_source(cls, input_path):
+        """Cubo del libro de ingresos, cacheado en npz junto a la fuente"""
+        directory, name = os.path.split(os.path.abspath(input_path))
+        cache_path = os.path.join(
+            directory, READ_CACHE_DIRNAME, f"{name}.{source_signature(input_path)}.cube.npz"
+        )
+        if os.path.exists(cache_path):
+            with np.load(cache_path, allow_pickle=False) as data:
+                return cls(
+                    data['lines'].tolist(), data['departments'].tolist(), data['years'],
+                    data['values'], data['counts']
+                )
+
+        cube = cls.from_frame(read_file(input_path, columns=INCOME_COLUMNS))
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp.npz"
+        np.savez(
+            tmp_path,
+            lines=np.array(cube.lines, dtype=str), departments=cube.departments.astype(str),
+            years=cube.years, values=cube.values, counts=cube.counts
+        )
+        os.replace(tmp_path, cache_path)
+        # Cubos de versiones anteriores del libro
+        prune_cache_entries(cache_path, f"{glob.escape(name)}.*.cube.npz")
+        return cube
+
+    def matrix(self, objeto, rubro):
+        """Vista departamentos × años de un rubro (NaN donde no hay registros)"""
+        line = self._line_index.get((objeto, rubro))
+        if line is None:
+            raise KeyError(f"Rubro no encontrado: {objeto} / {rubro}")
+        return np.where(self.counts[line] > 0, self.values[line], np.nan)
+
+    def wide(self, objeto, rubro):
+        """Rubro como DataFrame departamentos × años"""
+        return pd.DataFrame(
+            self.matrix(objeto, rubro),
+            index=pd.Index(self.departments, name='DEPARTAMENTO'),
+            columns=pd.Index(self.years, name='AÑO')
+        )
+
+    def long(self, objeto, rubro, years_params=None):
+        """Rubro en formato largo (AÑO, DEPARTAMENTO, RECAUDADO), solo celdas con datos"""
+        df = self.wide(objeto, rubro).stack().dropna().rename('RECAUDADO').reset_index()
+        df = df[['AÑO', 'DEPARTAMENTO', 'RECAUDADO']].sort_values(['AÑO', 'DEPARTAMENTO'])
+        if years_params is not None:
+            df = df[(df['AÑO'] >= years_params['start']) & (df['AÑO'] <= years_params['end'])]
+        return df.reset_index(drop=True)
+
+def aggregate_in_chunks(input_path, objeto, rubro, years_params=None, chunksize=DEFAULT_CHUNKSIZE,
+                        month_col=None, date_col=None):
+    """
+    Agregación por bloques para registros a nivel transacción (SUCIVE).
+
+    Cada bloque se filtra por objeto/rubro, se agrega parcialmente por
+    (departamento, año[, mes]) con un groupby categórico y se suma al
+    acumulado, cuyo tamaño solo depende de la cantidad de grupos.
+
+    Args:
+        input_path: CSV, Parquet o .xlsx con las columnas de INCOME_COLUMNS
+        objeto, rubro: Línea de ingreso a agregar
+        years_params: Rango de años a conservar (opcional)
+        chunksize: Filas por bloque
+        month_col: Columna con el mes (1-12), si existe
+        date_col: Columna de fecha de la que derivar año y mes
+
+    Returns:
+        DataFrame largo (AÑO, DEPARTAMENTO[, MES], RECAUDADO)
+    """
+    columns = ['DEPARTAMENTO', 'RECAUDADO'] + ([date_col] if date_col else ['AÑO'] + ([month_col] if month_col else []))
+    keys = ['AÑO', 'DEPARTAMENTO'] + (['MES'] if month_col or date_col else [])
+    filters = [('OBJETO', '==', objeto), ('RUBRO', '==', rubro)]
+
+    total = None
+    for i, chunk in enumerate(read_chunks(input_path, columns=columns, filters=filters, chunksize=chunksize)):
+        if date_col:
+            dates = pd.to_datetime(chunk[date_col], errors='coerce')
+            chunk = chunk.assign(**{'AÑO': dates.dt.year, 'MES': dates.dt.month})
+        else:
+            chunk = chunk.assign(**{'AÑO': pd.to_numeric(chunk['AÑO'], errors='coerce')})
+            if month_col:
+                chunk = chunk.assign(MES=pd.to_numeric(chunk[month_col], errors='coerce'))
+        chunk = chunk.assign(RECAUDADO=pd.to_numeric(chunk['RECAUDADO'], errors='coerce'))
+        chunk = chunk.dropna(subset=keys + ['RECAUDADO'])
+        if years_params is not None:
+            chunk = chunk[(chunk['AÑO'] >= years_params['start']) & (chunk['AÑO'] <= years_params['end'])]
+
+        partial = (
+            chunk.astype({'DEPARTAMENTO': 'category'})
+            .groupby(keys, observed=True, sort=False)['RECAUDADO']
+            .sum()
+        )
+        # Categorías distintas por bloque: se alinean como texto
+        partial.index = partial.index.set_levels(
+            partial.index.levels[keys.index('DEPARTAMENTO')].astype(object), level='DEPARTAMENTO'
+        )
+        total = partial if total is None else total.add(partial, fill_value=0)
+        print(f"  Bloque {i + 1}: {len(chunk)} filas, {len(total)} grupos acumulados")
+
+    if total is None:
+        return pd.DataFrame(columns=keys + ['RECAUDADO'])
+
+    df = total.rename('RECAUDADO').reset_index()
+    df['AÑO'] = df['AÑO'].astype(np.int64)
+    if 'MES' in df:
+        df['MES'] = df['MES'].astype(np.int64)
+    return df.sort_values(keys).reset_index(drop=True)
+
+def process_vehicle_tax(input_path, ipc_path, output_path, years_params, exchange_rate, chunksize=None,
+                        month_col=None, date_col=None, panel_path=None):
+    """Procesa datos de patentes vehiculares
+
+    `ipc_path` puede ser la ruta al IPC procesado o la serie
+    publicada en memoria por `prices.process_cpi`. Con `chunksize` la
+    fuente se agrega por bloques (registros SUCIVE a nivel transacción)
+    en lugar de cargarse entera en el cubo de ingresos.
+
+    Con `month_col` o `date_col` (modo mensual, siempre por bloques) se
+    guarda además en `panel_path` el panel departamento × año × mes; la
+    salida principal sigue siendo el total anual.
+    """
     print("Cargando datos de patentes...")
-    df = read_file(input_path)
-    ipc_df = read_file(ipc_path, index_col='ano')
-    
-    # Procesar datos
-    filtered = filter_vehicle_tax(df)
-    grouped = group_by_department(filtered, years_params)
-    converted = convert_to_constant_usd(grouped, ipc_df, exchange_rate)
+    ipc_df = load_input(ipc_path, index_col='ano')
+    if isinstance(ipc_df, pd.Series):
+        ipc_df = ipc_df.to_frame()
     
     # Crear metadata básica
     metadata = {
@@ -37,96 +213,82 @@ def process_vehicle_tax(input_path, ipc_path, output_path, years_params, exchang
         }
     }
     
-    # Guardar resultados y metadata
-    ensure_dir(output_path)
-    converted.to_csv(output_path, index=False)
+    if month_col or date_col:
+        monthly = aggregate_in_chunks(
+            input_path, *VEHICLE_TAX_LINE, years_params=years_params,
+            chunksize=chunksize or DEFAULT_CHUNKSIZE, month_col=month_col, date_col=date_col
+        )
+        if panel_path is not None:
+            converter = ConstantUSDConverter(ipc_df, exchange_rate=exchange_rate)
+            panel = converter.convert_long(monthly, 'RECAUDADO', 'AÑO')
+            panel_metadata = {
+                'dataset': {
+                    **metadata['dataset'],
+                    'name': 'Recaudación mensual de patentes vehiculares por departamento',
+                    'temporal_coverage': {**metadata['dataset']['temporal_coverage'], 'frequency': 'mensual'}
+                }
+            }
+            save_with_metadata(panel, panel_path, panel_metadata)
+        grouped = monthly.groupby(['AÑO', 'DEPARTAMENTO'], as_index=False)['RECAUDADO'].sum()
+    elif chunksize:
+        grouped = aggregate_in_chunks(input_path, *VEHICLE_TAX_LINE, years_params=years_params, chunksize=chunksize)
+    else:
+        # Patente de rodados como una vista del cubo de ingresos
+        grouped = IncomeCube.from_source(input_path).long(*VEHICLE_TAX_LINE, years_params=years_params)
+    converted = convert_to_constant_usd(grouped, ipc_df, exchange_rate)
     
-    # Guardar metadata en YAML
-    metadata_path = os.path.join(os.path.dirname(output_path), 'metadata.yaml')
-    with open(metadata_path, 'w', encoding='utf-8') as f:
-        yaml.dump(metadata, f, allow_unicode=True, sort_keys=False)
+    # Guardar resultados con metadata embebida
+    save_with_metadata(converted, output_path, metadata)
     
     return converted, metadata
 
-def filter_vehicle_tax(df):
-    """Filtra y limpia datos de patentes vehiculares"""
-    # Asegurar que AÑO sea numérico (si ya lo es, no hace nada)
-    df['AÑO'] = pd.to_numeric(df['AÑO'], errors='coerce')
-    
-    # Filtrar solo patentes de rodados
-    filtered = df[
-        (df['OBJETO'] == 'Sobre Vehiculos') & 
-        (df['RUBRO'] == 'Patente de Rodados')
-    ].copy()
-    
-    # Filtrar filas con valores válidos
-    filtered = filtered[
-        filtered['RECAUDADO'].notna() & 
-        filtered['AÑO'].notna() & 
-        filtered['DEPARTAMENTO'].notna()
-    ]
-    
-    return filtered
-
-def group_by_department(df, years_params):
-    """Agrupa por departamento y año"""
-    grouped = df.groupby(['AÑO', 'DEPARTAMENTO'])['RECAUDADO'].sum().reset_index()
-    
-    # Filtrar por años configurados
-    grouped = grouped[
-        (grouped['AÑO'] >= years_params['start']) & 
-        (grouped['AÑO'] <= years_params['end'])
-    ]
-    
-    return grouped
-
 def convert_to_constant_usd(df, ipc_df, tc_2020):
     """Convierte a USD constantes usando IPC y tipo de cambio 2020"""
-    # Convertir el índice del IPC a año
-    ipc_df.index = pd.to_datetime(ipc_df.index).year
+    converter = ConstantUSDConverter(ipc_df, exchange_rate=tc_2020)
     
-    print(f"\nÍndice IPC después de conversión: {ipc_df.index.tolist()}")
+    print(f"\nAños con IPC: {converter.years.tolist()}")
     print(f"Años en df: {df['AÑO'].unique().tolist()}")
     
-    df['RECAUDADO'] = df.apply(
-        lambda x: (x['RECAUDADO'] * 100 / ipc_df.loc[x['AÑO']]) / tc_2020,
-        axis=1
-    )
-    return df.pivot(index='DEPARTAMENTO', columns='AÑO', values='RECAUDADO').reset_index()
+    converted = converter.convert_long(df, 'RECAUDADO', 'AÑO')
+    return converted.pivot(index='DEPARTAMENTO', columns='AÑO', values='RECAUDADO').reset_index()
 
 def create_final_vehicle_tax(
     original_path,
     estimated_path,
     output_path,
-    treatment_year=2007
+    treatment_year=2007,
+    synthetic_metadata=None,
+    provenance_path=None
 ):
-    """Combina datos estimados pre-2007 con datos reales post-2007"""
-    
-    # Cargar datos
-    df_original = read_file(original_path)
-    df_estimated = read_file(estimated_path)
-    
-    # Cargar metadata del control sintético
-    estimated_metadata_path = os.path.join(os.path.dirname(estimated_path), 'metadata.yaml')
-    with open(estimated_metadata_path, 'r', encoding='utf-8') as f:
-        synthetic_metadata = yaml.safe_load(f)
-    
-    # Crear DataFrame final
-    df_final = df_original.copy()
-    
-    # Identificar años a reemplazar
-    numeric_columns = df_final.columns[df_final.columns != 'DEPARTAMENTO']
-    years_to_update = numeric_columns[
-        pd.to_numeric(numeric_columns).astype(int) < treatment_year
-    ]
+    """Combina datos estimados pre-2007 con datos reales post-2007
+
+    `original_path` y `estimated_path` pueden ser rutas o DataFrames en
+    memoria. Sin `synthetic_metadata` se usan los metadatos de la
+    estimación (`attrs` del DataFrame o los guardados junto al archivo).
+    La procedencia por celda se guarda en `provenance_path` (por defecto
+    `<output_path>_provenance.csv`).
+    """
     
-    # Reemplazar valores pre-2007 para Montevideo
-    montevideo_mask = df_final['DEPARTAMENTO'] == 'Montevideo'
-    df_final.loc[montevideo_mask, years_to_update] = df_estimated[years_to_update].values
+    # Cargar datos (los nombres de año quedan como texto, igual que en CSV)
+    df_original = load_input(original_path)
+    df_estimated = load_input(estimated_path)
+    if synthetic_metadata is None:
+        synthetic_metadata = df_estimated.attrs
+    if 'metodologia' not in (synthetic_metadata or {}).get('dataset', {}):
+        raise ValueError(
+            "Falta `synthetic_metadata`: la estimación no trae metadatos con la metodología"
+        )
+    df_original.columns = df_original.columns.map(str)
+    df_estimated.columns = df_estimated.columns.map(str)
     
-    # Guardar resultado final
-    ensure_dir(os.path.dirname(output_path))
-    df_final.to_csv(output_path, index=False)
+    # Solo se empalman los años previos al tratamiento, alineados por
+    # departamento y año
+    observed = df_original.set_index('DEPARTAMENTO')
+    estimated = df_estimated.set_index('DEPARTAMENTO')
+    estimated = estimated.loc[:, pd.to_numeric(estimated.columns).astype(int) < treatment_year]
+    spliced, provenance = splice_panels(observed, {'control_sintetico': estimated})
+    df_final = spliced.rename_axis('DEPARTAMENTO').reset_index()
+    estimated_units = estimated.index.tolist()
     
     # Crear metadata combinada
     metadata = {
@@ -135,18 +297,25 @@ def create_final_vehicle_tax(
             'descripcion': 'Combina estimaciones pre-2007 con datos reales post-2007',
             'fuentes': [
                 'Datos reales: OPP Uruguay',
-                'Datos estimados: Control sintético para Montevideo'
+                f'Datos estimados: Control sintético para {", ".join(estimated_units)}'
             ],
             'notas': [
-                f'Pre-{treatment_year}: Datos estimados para Montevideo',
+                f'Pre-{treatment_year}: Datos estimados para {", ".join(estimated_units)}',
                 f'{treatment_year} en adelante: Datos reales para todos los departamentos'
             ],
-            'metodologia': synthetic_metadata['dataset']['metodologia']
+            'metodologia': synthetic_metadata['dataset']['metodologia'],
+            'procedencia': {
+                label: int(count) for label, count in provenance.stack().value_counts().items()
+            }
         }
     }
     
-    metadata_path = os.path.join(os.path.dirname(output_path), 'metadata.yaml')
-    with open(metadata_path, 'w', encoding='utf-8') as f:
-        yaml.dump(metadata, f, allow_unicode=True, sort_keys=False)
+    # Guardar resultado final con metadata embebida
+    save_with_metadata(df_final, output_path, metadata)
+    
+    # Procedencia por celda (observado / control_sintetico)
+    if provenance_path is None:
+        provenance_path = os.path.splitext(str(output_path))[0] + '_provenance.csv'
+    save_with_metadata(provenance.rename_axis('DEPARTAMENTO').reset_index(), provenance_path)
     
     return df_final, metadata 
\ No newline at end of file
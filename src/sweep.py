@@ -0,0 +1,98 @@
+"""
+Lanzador local de barridos (multirun) en paralelo.
+
+Cada combinación de overrides corre como un trabajo en un pool de
+procesos. Todos los trabajos comparten el cache de etapas y el cache
+columnar de lecturas, de modo que las etapas con la misma clave (mismas
+entradas, parámetros y código) se calculan una sola vez: si dos
+trabajos difieren solo en parámetros de etapas finales, reutilizan
+los resultados de las etapas previas.
+
+Las salidas en data/ son compartidas entre trabajos (igual que en un
+multirun de Hydra): al terminar reflejan el último trabajo que escribió
+cada archivo. Los reportes por trabajo quedan en multirun/<fecha>/<n>.
+
+Uso:
+    python -m src.sweep process=process1,process2 params.years.start=1990,2000 --jobs 4
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import List
+from hydra import compose, initialize_config_dir
+from hydra.core.override_parser.overrides_parser import OverridesParser
+from omegaconf import OmegaConf
+import argparse
+import itertools
+import os
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config')
+
+def expand_overrides(overrides: List[str]) -> List[List[str]]:
+    """Expande overrides de barrido (a,b / range(...)) al producto cartesiano"""
+    parsed = OverridesParser.create().parse_overrides(overrides)
+    choices = []
+    for override in parsed:
+        key = override.get_key_element()
+        if override.is_sweep_override():
+            choices.append([f"{key}={v}" for v in override.sweep_string_iterator()])
+        else:
+            choices.append([override.input_line])
+    return [list(combo) for combo in itertools.product(*choices)]
+
+def compose_job(overrides: List[str]) -> dict:
+    """Compone y resuelve la configuración de un trabajo"""
+    with initialize_config_dir(config_dir=os.path.abspath(CONFIG_DIR), version_base="1.2"):
+        cfg = compose(config_name="main", overrides=overrides)
+    return OmegaConf.to_container(cfg, resolve=True)
+
+def run_job(job_num: int, overrides: List[str], cfg_dict: dict, output_dir: str):
+    """Ejecuta un trabajo del barrido (en un proceso del pool)"""
+    from src.process import run
+
+    cfg = OmegaConf.create(cfg_dict)
+    os.makedirs(output_dir, exist_ok=True)
+    OmegaConf.save(cfg, os.path.join(output_dir, 'config.yaml'))
+    OmegaConf.save(OmegaConf.create(overrides), os.path.join(output_dir, 'overrides.yaml'))
+
+    print(f"[job {job_num}] {' '.join(overrides)}")
+    # Dentro de cada trabajo las etapas usan hilos; el paralelismo
+    # entre trabajos lo da el pool de procesos
+    run(cfg, output_dir, executor='thread', reuse_variants=True)
+    return job_num
+
+def launch(overrides: List[str], jobs: int = None, sweep_dir: str = None):
+    """
+    Lanza todas las combinaciones del barrido en paralelo.
+
+    Args:
+        overrides: Overrides estilo Hydra, con valores separados por coma
+        jobs: Trabajos simultáneos (por defecto, cantidad de CPUs)
+        sweep_dir: Directorio de salida del barrido
+    """
+    if "PROJECT_ROOT" not in os.environ:
+        raise ValueError("PROJECT_ROOT environment variable must be set")
+
+    sweep_dir = sweep_dir or os.path.join(
+        'multirun', datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+    )
+    job_overrides = expand_overrides(overrides)
+    print(f"Lanzando {len(job_overrides)} trabajos en {sweep_dir}")
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [
+            pool.submit(
+                run_job, num, job, compose_job(job), os.path.join(sweep_dir, str(num))
+            )
+            for num, job in enumerate(job_overrides)
+        ]
+        for future in as_completed(futures):
+            print(f"✓ Trabajo {future.result()} completado")
+
+    return sweep_dir
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('overrides', nargs='*', help="Overrides estilo Hydra")
+    parser.add_argument('--jobs', type=int, default=None, help="Trabajos simultáneos")
+    args = parser.parse_args()
+    launch(args.overrides, jobs=args.jobs)
@@ -0,0 +1,226 @@
+"""
+Conversión vectorizada a precios constantes y dólares
+"""
+import numpy as np
+import os
+import pandas as pd
+
+def to_years(values) -> np.ndarray:
+    """Años enteros a partir de fechas, períodos, años numéricos o textos"""
+    index = pd.Index(values)
+    if isinstance(index, (pd.DatetimeIndex, pd.PeriodIndex)):
+        return index.year.to_numpy(dtype=np.int64)
+    years = pd.to_numeric(index, errors='coerce').to_numpy(dtype=np.float64)
+    if np.isnan(years).any():
+        # Fechas como texto (p.ej. '1990-12-31' leído de un CSV)
+        dates = pd.to_datetime(index, errors='coerce')
+        if dates.isna().any():
+            raise ValueError("Hay años no numéricos o faltantes")
+        return dates.year.to_numpy(dtype=np.int64)
+    return years.astype(np.int64)
+
+def dense_by_year(series) -> tuple:
+    """
+    Serie indexada por año (o fecha) como arreglo denso.
+
+    Returns:
+        (primer_año, arreglo) con NaN en los años sin dato; si hay varias
+        observaciones por año se conserva la última.
+    """
+    if isinstance(series, pd.DataFrame):
+        series = series.iloc[:, 0]
+    years = to_years(series.index)
+    values = pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float64)
+    first = int(years.min())
+    dense = np.full(int(years.max()) - first + 1, np.nan)
+    dense[years - first] = values
+    return first, dense
+
+
+class ConstantUSDConverter:
+    """
+    Factores de conversión a precios constantes (y opcionalmente a USD)
+    precalculados por año. La conversión de columnas o matrices se
+    resuelve con un único indexado de arreglos, sin búsquedas por fila.
+
+        valor_constante = valor * 100 / indice[año] / tipo_de_cambio[año]
+
+    Args:
+        price_index: IPC o deflactor indexado por año o fecha (base 100)
+        exchange_rate: Tipo de cambio fijo (p.ej. el del año base) o serie
+            por año; None para no convertir de moneda
+        strict: Si un año sin índice o tipo de cambio es un error (True)
+            o produce NaN (False)
+    """
+
+    def __init__(self, price_index, exchange_rate=None, strict: bool = True):
+        self.strict = strict
+        self.first_year, index = dense_by_year(price_index)
+        factor = 100 / index
+
+        if isinstance(exchange_rate, (pd.Series, pd.DataFrame)):
+            fx_first, fx = dense_by_year(exchange_rate)
+            # Alinear el tipo de cambio al rango del índice
+            aligned = np.full(len(factor), np.nan)
+            lo = max(self.first_year, fx_first)
+            hi = min(self.first_year + len(factor), fx_first + len(fx))
+            if hi > lo:
+                aligned[lo - self.first_year:hi - self.first_year] = fx[lo - fx_first:hi - fx_first]
+            factor = factor / aligned
+        elif exchange_rate is not None:
+            factor = factor / float(exchange_rate)
+
+        self.factor = factor
+
+    @property
+    def years(self) -> np.ndarray:
+        """Años cubiertos por los factores"""
+        return np.arange(self.first_year, self.first_year + len(self.factor))
+
+    def factors(self, years) -> np.ndarray:
+        """Factor multiplicativo para cada año (o fecha) de `years`"""
+        years = to_years(years)
+        position = years - self.first_year
+        inside = (position >= 0) & (position < len(self.factor))
+        result = np.full(len(years), np.nan)
+        result[inside] = self.factor[position[inside]]
+
+        if self.strict:
+            missing = np.isnan(result)
+            if missing.any():
+                raise ValueError(
+                    f"Años sin índice de precios o tipo de cambio: {sorted(set(years[missing].tolist()))}"
+                )
+        return result
+
+    def convert(self, values, years):
+        """Convierte una columna de valores según el año de cada fila"""
+        factors = self.factors(years)
+        if isinstance(values, pd.Series):
+            return values * factors
+        return np.asarray(values, dtype=np.float64) * factors
+
+    def convert_long(self, df: pd.DataFrame, value_cols, year_col: str) -> pd.DataFrame:
+        """Convierte columnas de un DataFrame largo (una fila por año/fecha)"""
+        if isinstance(value_cols, str):
+            value_cols = [value_cols]
+        factors = self.factors(df[year_col])
+        df = df.copy()
+        df[value_cols] = df[value_cols].to_numpy(dtype=np.float64) * factors[:, None]
+        return df
+
+    def convert_wide(self, df: pd.DataFrame, id_cols=None) -> pd.DataFrame:
+        """Convierte una matriz ancha con un año por columna"""
+        id_cols = list(id_cols or [])
+        year_cols = [c for c in df.columns if c not in id_cols]
+        factors = self.factors(year_cols)
+        df = df.copy()
+        df[year_cols] = df[year_cols].to_numpy(dtype=np.float64) * factors[None, :]
+        return df
+
+    @classmethod
+    def from_factors(cls, first_year: int, factor: np.ndarray, strict: bool = True):
+        """Conversor a partir de un arreglo de factores ya calculado"""
+        converter = cls.__new__(cls)
+        converter.strict = strict
+        converter.first_year = int(first_year)
+        converter.factor = np.asarray(factor, dtype=np.float64)
+        return converter
+
+
+class RealValueCube:
+    """
+    Cubo de factores de conversión a valores reales sobre
+    (año, año_base, deflactor, moneda) para valores nominales en pesos.
+
+    - 'uy_cpi': deflacta en pesos con el IPC uruguayo; en USD se expresa
+      al tipo de cambio del año base.
+    - 'us_gdpdef': convierte a USD al tipo de cambio de cada año y
+      deflacta con el deflactor del PIB de EE.UU.; en pesos se expresa
+      al tipo de cambio del año base.
+
+    Cualquier panel se lleva a otra base, deflactor o moneda con una
+    sola multiplicación, sin volver a correr el pipeline.
+
+    Args:
+        cpi: IPC uruguayo anual (cualquier base)
+        gdp_deflator: Deflactor del PIB de EE.UU. anual (cualquier base)
+        exchange_rate: Pesos por dólar, promedio anual
+    """
+
+    DEFLATORS = ('uy_cpi', 'us_gdpdef')
+    CURRENCIES = ('UYU', 'USD')
+
+    def __init__(self, cpi, gdp_deflator, exchange_rate):
+        series = [dense_by_year(s) for s in (cpi, gdp_deflator, exchange_rate)]
+        # Rango común a las tres series
+        self.first_year = max(first for first, _ in series)
+        last_year = min(first + len(values) for first, values in series)
+        if last_year <= self.first_year:
+            raise ValueError("IPC, deflactor y tipo de cambio no tienen años en común")
+        cpi, gdpdef, fx = (
+            values[self.first_year - first:last_year - first] for first, values in series
+        )
+        self.fx = fx
+
+        # cube[año, base, deflactor, moneda]
+        cube = np.empty((len(fx), len(fx), len(self.DEFLATORS), len(self.CURRENCIES)))
+        cube[:, :, 0, 0] = cpi[None, :] / cpi[:, None]
+        cube[:, :, 0, 1] = cube[:, :, 0, 0] / fx[None, :]
+        cube[:, :, 1, 1] = gdpdef[None, :] / (gdpdef[:, None] * fx[:, None])
+        cube[:, :, 1, 0] = cube[:, :, 1, 1] * fx[None, :]
+        self.cube = cube
+
+    @property
+    def years(self) -> np.ndarray:
+        """Años cubiertos (tanto de valores como de bases)"""
+        return np.arange(self.first_year, self.first_year + len(self.fx))
+
+    def _position(self, year: int, what: str) -> int:
+        position = int(year) - self.first_year
+        if not 0 <= position < len(self.fx):
+            raise ValueError(f"{what} {year} fuera del rango {self.first_year}-{self.years[-1]}")
+        return position
+
+    def factor_matrix(self, deflator: str = 'uy_cpi', currency: str = 'USD',
+                      source_currency: str = 'UYU') -> np.ndarray:
+        """Matriz (año, año_base) de factores para un deflactor y moneda"""
+        matrix = self.cube[:, :, self.DEFLATORS.index(deflator), self.CURRENCIES.index(currency)]
+        if source_currency == 'USD':
+            # Valores nominales en dólares: primero a pesos del mismo año
+            matrix = matrix * self.fx[:, None]
+        elif source_currency != 'UYU':
+            raise ValueError(f"Moneda de origen no soportada: {source_currency}")
+        return matrix
+
+    def converter(self, base_year: int, deflator: str = 'uy_cpi', currency: str = 'USD',
+                  source_currency: str = 'UYU', strict: bool = True) -> ConstantUSDConverter:
+        """Conversor a valores reales para una combinación del cubo"""
+        base = self._position(base_year, 'Año base')
+        factor = self.factor_matrix(deflator, currency, source_currency)[:, base]
+        return ConstantUSDConverter.from_factors(self.first_year, factor, strict=strict)
+
+    def rebase_factor(self, from_base: int, to_base: int, deflator: str = 'uy_cpi',
+                      currency: str = 'USD') -> float:
+        """Factor que lleva valores reales de una base a otra"""
+        matrix = self.factor_matrix(deflator, currency)
+        ratio = matrix[:, self._position(to_base, 'Año base')] / matrix[:, self._position(from_base, 'Año base')]
+        # Para un mismo deflactor y moneda el cociente no depende del año
+        return float(np.nanmean(ratio))
+
+    def save(self, path: str):
+        """Guarda el cubo en formato npz"""
+        directory = os.path.dirname(str(path))
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        np.savez(path, first_year=self.first_year, fx=self.fx, cube=self.cube)
+
+    @classmethod
+    def load(cls, path: str):
+        """Carga un cubo guardado con `save`"""
+        with np.load(path) as data:
+            cube = cls.__new__(cls)
+            cube.first_year = int(data['first_year'])
+            cube.fx = data['fx']
+            cube.cube = data['cube']
+        return cube
@@ -1,10 +1,60 @@
 """
 Funciones de entrada/salida
 """
+import datetime
+import glob
+import hashlib
+import importlib.util
+import json
 import os
+import threading
 import pandas as pd
+import yaml
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager, suppress
 from pathlib import Path
 
+# Escritor en segundo plano activo (ver `background_writes`) y el
+# proceso que lo creó: los hijos de un fork no tienen su hilo escritor
+_writer = None
+_writer_pid = None
+_pending_writes = []
+_writer_lock = threading.Lock()
+# Escrituras lanzadas por el hilo actual (ver `collect_writes`)
+_collector = threading.local()
+
+def _reset_writer_after_fork():
+    # La copia del lock pudo quedar tomada por un hilo que no existe en el hijo
+    global _writer, _writer_pid, _pending_writes, _writer_lock
+    _writer, _writer_pid, _pending_writes = None, None, []
+    _writer_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_writer_after_fork)
+
+# Cache columnar de lecturas: Parquet en un subdirectorio `.cache` junto
+# al archivo fuente, invalidado por mtime y tamaño del archivo
+READ_CACHE_DIRNAME = '.cache'
+READ_CACHE_MAX_BYTES = int(os.environ.get('SUCIVE_READ_CACHE_MAX_BYTES', 512 * 1024 ** 2))
+_UNCACHEABLE_KWARGS = {'chunksize', 'iterator', 'nrows'}
+# Columnas object que Parquet no representa (tipos mixtos) se guardan como
+# texto junto a una columna auxiliar con el tipo original de cada valor
+READ_CACHE_COERCED_KEY = b'sucive.coerced_columns'
+_TYPE_PREFIX = '__tipo__'
+_TYPE_PARSERS = {
+    'int': int,
+    'float': float,
+    'bool': lambda s: s == 'True',
+    'NoneType': lambda s: None,
+    'NaTType': lambda s: pd.NaT,
+    'Timestamp': pd.Timestamp,
+    'datetime': datetime.datetime.fromisoformat,
+    'date': datetime.date.fromisoformat,
+    'time': datetime.time.fromisoformat,
+}
+_read_cache_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
 def ensure_dir(path):
     """
     Asegura que el directorio padre del path existe, creándolo si es necesario.
@@ -22,27 +72,519 @@ def ensure_dir(path):
         else:
             os.makedirs(str(path), exist_ok=True)
 
-def read_file(file_path, **kwargs):
-    """Lee un archivo según su extensión"""
+def read_file(file_path, columns=None, filters=None, cache=True, **kwargs):
+    """
+    Lee un archivo según su extensión.
+
+    Si `cache` es True (y pyarrow está disponible) el resultado se guarda
+    como Parquet junto al archivo fuente; las lecturas siguientes con los
+    mismos argumentos decodifican columnas tipadas en lugar de volver a
+    parsear el CSV o el Excel. El cache se invalida si cambia el mtime o
+    el tamaño del archivo fuente.
+
+    Args:
+        file_path: Ruta al archivo
+        columns: Columnas a materializar (proyección)
+        filters: Predicados de fila como tuplas (columna, operador, valor),
+            con operadores '==', '!=', '<', '<=', '>', '>=', 'in', 'not in'
+        cache: Si usar el cache columnar
+        **kwargs: Argumentos para pd.read_csv / pd.read_excel
+    """
     ext = os.path.splitext(file_path)[1].lower()
+    if ext == '.parquet':
+        return read_artifact(file_path, columns=columns, filters=filters)
+    if ext not in ['.csv', '.xls', '.xlsx']:
+        raise ValueError(f"Formato de archivo no soportado: {ext}")
+
+    if not (cache and _parquet_available() and _UNCACHEABLE_KWARGS.isdisjoint(kwargs)):
+        # Sin cache la proyección se empuja al lector (usecols)
+        if columns is not None:
+            filter_cols = [f[0] for f in filters or [] if f[0] not in columns]
+            kwargs['usecols'] = list(columns) + filter_cols
+        df = _read_source(file_path, ext, **kwargs)
+        return _project(df, columns, filters)
+
+    # El cache guarda la tabla completa; proyección y filtros se
+    # empujan a la lectura del Parquet
+    cache_path = _read_cache_path(file_path, kwargs)
+    if os.path.exists(cache_path):
+        try:
+            df = _read_cache(cache_path, columns, filters)
+            os.utime(cache_path)  # Marca de uso para la política LRU
+            _count_read_cache('hits')
+            return df
+        except Exception as e:
+            print(f"Cache corrupto en {cache_path}, se vuelve a leer la fuente: {e}")
+
+    _count_read_cache('misses')
+    df = _read_source(file_path, ext, **kwargs)
+    if isinstance(df, pd.DataFrame):
+        _store_read_cache(df, file_path, cache_path)
+        df = _project(df, columns, filters)
+    return df
+
+_FILTER_OPS = {
+    '==': lambda s, v: s == v,
+    '=': lambda s, v: s == v,
+    '!=': lambda s, v: s != v,
+    '<': lambda s, v: s < v,
+    '<=': lambda s, v: s <= v,
+    '>': lambda s, v: s > v,
+    '>=': lambda s, v: s >= v,
+    'in': lambda s, v: s.isin(v),
+    'not in': lambda s, v: ~s.isin(v),
+}
+
+def _project(df, columns=None, filters=None):
+    """Aplica filtros de fila y proyección de columnas en memoria"""
+    if filters:
+        mask = pd.Series(True, index=df.index)
+        for column, op, value in filters:
+            if op not in _FILTER_OPS:
+                raise ValueError(f"Operador de filtro no soportado: {op}")
+            mask &= _FILTER_OPS[op](df[column], value)
+        df = df[mask]
+    if columns is not None:
+        df = df[list(columns)]
+    return df
+
+def read_chunks(file_path, columns=None, filters=None, chunksize=1_000_000):
+    """
+    Lee CSV, Parquet o Excel (.xlsx) en bloques de a lo sumo `chunksize`
+    filas, aplicando filtros y proyección a cada bloque. La memoria
+    máxima depende del tamaño de bloque, no del archivo.
+    """
+    ext = os.path.splitext(str(file_path))[1].lower()
+    read_columns = None
+    if columns is not None:
+        read_columns = list(dict.fromkeys(list(columns) + [f[0] for f in filters or []]))
+
     if ext == '.csv':
-        return pd.read_csv(file_path, **kwargs)
-    elif ext in ['.xls', '.xlsx']:
-        return pd.read_excel(file_path, **kwargs)
+        chunks = pd.read_csv(file_path, usecols=read_columns, chunksize=chunksize)
+    elif ext == '.parquet':
+        import pyarrow.parquet as pq
+
+        batches = pq.ParquetFile(file_path).iter_batches(batch_size=chunksize, columns=read_columns)
+        chunks = (batch.to_pandas() for batch in batches)
+    elif ext == '.xlsx':
+        chunks = _excel_chunks(file_path, read_columns, chunksize)
     else:
-        raise ValueError(f"Formato de archivo no soportado: {ext}")
+        raise ValueError(f"Formato no soportado para lectura por bloques: {ext}")
+
+    for chunk in chunks:
+        yield _project(chunk, columns, filters)
+
+def _excel_chunks(file_path, columns, chunksize):
+    """Filas de la primera hoja con openpyxl en modo solo lectura"""
+    from itertools import islice
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = list(next(rows))
+        positions = [header.index(c) for c in columns] if columns is not None else list(range(len(header)))
+        names = [header[i] for i in positions]
+        while True:
+            block = list(islice(rows, chunksize))
+            if not block:
+                break
+            yield pd.DataFrame([[row[i] for i in positions] for row in block], columns=names)
+    finally:
+        workbook.close()
+
+def _read_source(file_path, ext, **kwargs):
+    """Lee el archivo fuente con pandas"""
+    if ext == '.csv':
+        return pd.read_csv(file_path, **kwargs)
+    return pd.read_excel(file_path, **kwargs)
+
+def _parquet_available():
+    return importlib.util.find_spec('pyarrow') is not None
+
+def source_signature(file_path):
+    """Firma del archivo fuente (mtime y tamaño)"""
+    stat = os.stat(file_path)
+    return hashlib.sha1(f"{stat.st_mtime_ns}:{stat.st_size}".encode()).hexdigest()[:12]
+
+def _read_cache_path(file_path, kwargs):
+    """Ruta del Parquet para el archivo y los argumentos de lectura"""
+    args_digest = hashlib.sha1(repr(sorted(kwargs.items())).encode()).hexdigest()[:12]
+    directory, name = os.path.split(os.path.abspath(file_path))
+    return os.path.join(
+        directory,
+        READ_CACHE_DIRNAME,
+        f"{name}.{source_signature(file_path)}.{args_digest}.parquet"
+    )
+
+def _count_read_cache(event):
+    with _stats_lock:
+        _read_cache_stats[event] += 1
+
+def read_cache_stats() -> dict:
+    """Aciertos y fallos del cache de lectura en este proceso"""
+    with _stats_lock:
+        return dict(_read_cache_stats)
+
+def _coerce_object_columns(df):
+    """
+    Convierte a texto las columnas object que Parquet no puede representar
+    (p.ej. números mezclados con textos, o datetime.time con textos) y
+    agrega por cada una la columna auxiliar con el tipo de cada valor.
+
+    Returns:
+        (DataFrame a guardar, columnas convertidas)
+    """
+    import pyarrow as pa
+
+    coerced = []
+    for column in df.select_dtypes(include='object').columns:
+        try:
+            pa.array(df[column], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            coerced.append(column)
+    if coerced:
+        df = df.copy()
+        for column in coerced:
+            values = df[column]
+            df[_TYPE_PREFIX + column] = values.map(lambda v: type(v).__name__).astype('category')
+            df[column] = values.map(str)
+    return df, coerced
+
+def _restore_object_columns(df, coerced):
+    """Devuelve a cada valor de las columnas convertidas su tipo original"""
+    for column in coerced:
+        tag_column = _TYPE_PREFIX + column
+        if tag_column not in df:
+            continue
+        tags = df.pop(tag_column).astype(object).to_numpy()
+        values = df[column].astype(object).to_numpy()
+        for tag in set(tags):
+            parser = _TYPE_PARSERS.get(tag)
+            if parser is None:
+                continue  # str y tipos sin conversión quedan como texto
+            mask = tags == tag
+            values[mask] = [parser(v) for v in values[mask]]
+        df[column] = pd.Series(values, index=df.index, dtype=object)
+    return df
+
+def _read_cache(cache_path, columns=None, filters=None):
+    """
+    Lee el Parquet del cache. Los filtros sobre columnas convertidas a
+    texto se aplican en memoria, después de restaurar sus valores.
+    """
+    import pyarrow.parquet as pq
+
+    schema_metadata = pq.read_schema(cache_path).metadata or {}
+    coerced = json.loads(schema_metadata.get(READ_CACHE_COERCED_KEY, b'[]'))
+    read_columns = None
+    if columns is not None:
+        read_columns = list(dict.fromkeys(list(columns) + [f[0] for f in filters or []]))
+        read_columns += [_TYPE_PREFIX + c for c in read_columns if c in coerced]
+    pushed = [tuple(f) for f in filters or [] if f[0] not in coerced]
+    remaining = [f for f in filters or [] if f[0] in coerced]
+
+    table = pq.read_table(
+        cache_path, columns=read_columns, filters=pushed or None, use_pandas_metadata=True
+    )
+    df = _restore_object_columns(table.to_pandas(), coerced)
+    if columns is None and not remaining:
+        return df
+    return _project(df, columns, remaining)
+
+def _store_read_cache(df, file_path, cache_path):
+    """Guarda el Parquet de forma atómica y aplica invalidación y desalojo"""
+    if not all(isinstance(c, str) for c in df.columns):
+        return  # Parquet requiere nombres de columna de texto
+
+    cache_dir = os.path.dirname(cache_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = _tmp_path(cache_path)
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
 
-def save_with_metadata(df: pd.DataFrame, output_path: str, metadata: dict = None):
-    """Guarda DataFrame con metadatos en CSV"""
+        stored, coerced = _coerce_object_columns(df)
+        table = pa.Table.from_pandas(stored)
+        schema_metadata = dict(table.schema.metadata or {})
+        schema_metadata[READ_CACHE_COERCED_KEY] = json.dumps(coerced).encode()
+        pq.write_table(table.replace_schema_metadata(schema_metadata), tmp_path)
+        os.replace(tmp_path, cache_path)
+    except Exception as e:
+        # Tipos mixtos u otros casos no representables: se lee sin cache
+        print(f"No se pudo cachear {os.path.basename(file_path)}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return
+
+    # Invalidar entradas de versiones anteriores del mismo archivo
+    name = os.path.basename(file_path)
+    signature = source_signature(file_path)
+    for entry in glob.glob(os.path.join(cache_dir, f"{glob.escape(name)}.*.parquet")):
+        if not os.path.basename(entry).startswith(f"{name}.{signature}."):
+            with suppress(FileNotFoundError):
+                os.remove(entry)
+
+    _evict_read_cache(cache_dir)
+
+def _evict_read_cache(cache_dir, max_bytes=None):
+    """Desaloja las entradas menos usadas hasta respetar el tamaño máximo"""
+    max_bytes = READ_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = []
+    paths = glob.glob(os.path.join(cache_dir, '*.parquet')) + glob.glob(os.path.join(cache_dir, '*.npz'))
+    for path in paths:
+        if _is_tmp_entry(path):
+            continue  # escritura en curso
+        with suppress(FileNotFoundError):
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        with suppress(FileNotFoundError):
+            os.remove(path)
+        total -= size
+
+def _is_tmp_entry(path) -> bool:
+    return path.endswith(('.tmp', '.tmp.npz'))
+
+def prune_cache_entries(keep, pattern):
+    """
+    Elimina del directorio de `keep` las entradas que coinciden con
+    `pattern` (versiones anteriores de un mismo arreglo cacheado junto a
+    su fuente), salvo `keep` y las escrituras en curso, y aplica el
+    tamaño máximo del cache.
+    """
+    cache_dir = os.path.dirname(keep)
+    for entry in glob.glob(os.path.join(cache_dir, pattern)):
+        if entry != keep and not _is_tmp_entry(entry):
+            with suppress(FileNotFoundError):
+                os.remove(entry)
+    _evict_read_cache(cache_dir)
+
+def clear_read_cache(file_path):
+    """Elimina el cache columnar asociado a un archivo fuente"""
+    directory, name = os.path.split(os.path.abspath(file_path))
+    pattern = os.path.join(directory, READ_CACHE_DIRNAME, f"{glob.escape(name)}.*.parquet")
+    for entry in glob.glob(pattern):
+        with suppress(FileNotFoundError):
+            os.remove(entry)
+
+def load_input(source, **kwargs):
+    """
+    Devuelve una copia del objeto si ya está en memoria (DataFrame o
+    Series publicado por otra etapa) o lo lee desde disco si es un path.
+    Desde disco prefiere el artefacto Parquet, que conserva el índice y
+    los tipos (los `kwargs` describen la lectura del CSV).
+    """
+    if isinstance(source, (pd.DataFrame, pd.Series)):
+        return source.copy()
+    return load_data_with_metadata(source, **kwargs)
+
+@contextmanager
+def background_writes(max_workers=2):
+    """
+    Mientras está activo, `save_with_metadata` persiste en segundo plano
+    y devuelve el control de inmediato. Al salir espera todas las
+    escrituras pendientes y propaga el primer error.
+
+    Solo escribe en segundo plano el proceso que abrió el contexto: en
+    los workers de un ProcessPool (fork) las escrituras son inmediatas,
+    para que sus errores lleguen a la etapa.
+    """
+    global _writer, _writer_pid
+    with _writer_lock:
+        if _writer is not None:
+            raise RuntimeError("Ya hay un escritor en segundo plano activo")
+        _writer = ThreadPoolExecutor(max_workers=max_workers)
+        _writer_pid = os.getpid()
+    try:
+        yield
+    finally:
+        flush_writes()
+        with _writer_lock:
+            _writer.shutdown()
+            _writer, _writer_pid = None, None
+
+def flush_writes():
+    """Espera a que terminen las escrituras en segundo plano"""
+    with _writer_lock:
+        futures = list(_pending_writes)
+        _pending_writes.clear()
+    wait(futures)
+    for future in futures:
+        future.result()
+
+@contextmanager
+def collect_writes():
+    """
+    Junta los Future de las escrituras en segundo plano que lanza el hilo
+    actual (p. ej. una etapa del pipeline) para esperar solo las suyas.
+    """
+    previous = getattr(_collector, 'futures', None)
+    _collector.futures = futures = []
+    try:
+        yield futures
+    finally:
+        _collector.futures = previous
+
+def _persist(func, *args, **kwargs):
+    """
+    Ejecuta una escritura en segundo plano si hay un escritor activo.
+    Devuelve el Future de la escritura (None si se escribió en el momento).
+    """
+    with _writer_lock:
+        if _writer is not None and _writer_pid == os.getpid():
+            future = _writer.submit(func, *args, **kwargs)
+            _pending_writes.append(future)
+            collected = getattr(_collector, 'futures', None)
+            if collected is not None:
+                collected.append(future)
+            return future
+    func(*args, **kwargs)
+    return None
+
+def wait_written(future):
+    """Espera una escritura devuelta por `save_with_metadata`"""
+    if future is not None:
+        future.result()
+
+# Artefactos tipados: Parquet con los metadatos embebidos en el esquema.
+# El CSV (más su <nombre>.metadata.yaml) queda como exportación opcional.
+ARTIFACT_METADATA_KEY = b'sucive.metadata'
+_export_csv = os.environ.get('SUCIVE_EXPORT_CSV', '1') != '0'
+
+def set_csv_export(enabled: bool):
+    """Activa o desactiva la exportación CSV junto a cada artefacto"""
+    global _export_csv
+    _export_csv = bool(enabled)
+    # Los workers del ProcessPool heredan el entorno
+    os.environ['SUCIVE_EXPORT_CSV'] = '1' if _export_csv else '0'
+
+def csv_export_enabled() -> bool:
+    """Si se escriben las exportaciones de texto (CSV, GeoJSON, shapefile)"""
+    return _export_csv
+
+def artifact_path(output_path) -> str:
+    """Ruta del artefacto Parquet correspondiente a una ruta de salida"""
+    return str(Path(str(output_path)).with_suffix('.parquet'))
+
+def metadata_path(output_path) -> str:
+    """Ruta del YAML de metadatos de una salida (uno por artefacto)"""
+    return str(Path(str(output_path)).with_suffix('.metadata.yaml'))
+
+def _tmp_path(path) -> str:
+    """Temporal único por proceso e hilo para escrituras atómicas"""
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+def save_with_metadata(df, output_path, metadata: dict = None, index: bool = False, export_csv: bool = None):
+    """
+    Guarda un DataFrame (o Series) como artefacto Parquet con metadatos
+    embebidos. Si la exportación CSV está activa también escribe el CSV
+    en `output_path` y su `<nombre>.metadata.yaml`.
+
+    Sin pyarrow se guarda solo el CSV con su YAML de metadatos.
+
+    Returns:
+        Future de la escritura en segundo plano (None si ya se escribió)
+    """
+    if isinstance(df, pd.Series):
+        df = df.to_frame()
+    df = df.copy()
+    metadata = metadata or {}
+    export_csv = _export_csv if export_csv is None else export_csv
+    parquet = _parquet_available()
     ensure_dir(output_path)
-    if metadata:
-        df = add_metadata(df, metadata)
-    df.to_csv(output_path, index=False)
-
-def load_data_with_metadata(input_path: str) -> pd.DataFrame:
-    """Carga DataFrame preservando metadatos"""
-    df = read_file(input_path)
-    df.attrs = get_csv_metadata(input_path)
+    return _persist(_write_artifacts, df, str(output_path), metadata, index, export_csv or not parquet, parquet)
+
+def _write_artifacts(df, output_path, metadata, index, export_csv, parquet):
+    """
+    Escribe las salidas en una sola tarea: primero el CSV y su YAML, al
+    final el Parquet, de modo que el artefacto nunca es más viejo que el
+    CSV que lo acompaña (ver `_fresh_artifact`).
+    """
+    if export_csv:
+        tmp_path = _tmp_path(output_path)
+        df.to_csv(tmp_path, index=index)
+        os.replace(tmp_path, output_path)
+        if metadata:
+            _write_yaml(metadata, metadata_path(output_path))
+    if parquet:
+        _write_parquet_artifact(df, artifact_path(output_path), metadata, index)
+
+def _write_parquet_artifact(df, path, metadata, index):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Parquet requiere nombres de columna de texto (igual que en el CSV)
+    df = df.set_axis(df.columns.map(str), axis=1)
+    table = pa.Table.from_pandas(df, preserve_index=index)
+    schema_metadata = dict(table.schema.metadata or {})
+    schema_metadata[ARTIFACT_METADATA_KEY] = json.dumps(metadata, default=str).encode()
+    table = table.replace_schema_metadata(schema_metadata)
+
+    tmp_path = _tmp_path(path)
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+
+def _write_yaml(metadata, path):
+    tmp_path = _tmp_path(path)
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        yaml.dump(metadata, f, allow_unicode=True, sort_keys=False)
+    os.replace(tmp_path, path)
+
+def read_artifact(path, columns=None, filters=None) -> pd.DataFrame:
+    """Lee un artefacto Parquet con sus metadatos en `df.attrs`"""
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(
+        path,
+        columns=list(columns) if columns is not None else None,
+        filters=[tuple(f) for f in filters] if filters else None
+    )
+    schema_metadata = table.schema.metadata or {}
+    df = table.to_pandas()
+    df.attrs = json.loads(schema_metadata.get(ARTIFACT_METADATA_KEY, b'{}'))
+    return df
+
+def _fresh_artifact(input_path):
+    """Artefacto Parquet de `input_path` si existe y no es más viejo que el CSV"""
+    if str(input_path).endswith('.parquet'):
+        return str(input_path)
+    path = artifact_path(input_path)
+    if not (_parquet_available() and os.path.exists(path)):
+        return None
+    if os.path.exists(input_path) and os.path.getmtime(path) < os.path.getmtime(input_path):
+        return None
+    return path
+
+def load_data_with_metadata(input_path: str, **kwargs) -> pd.DataFrame:
+    """
+    Carga DataFrame preservando metadatos. Prefiere el artefacto
+    Parquet (tipos exactos, sin inferencia); si no existe lee el CSV
+    (con `kwargs`) y toma los metadatos de sus comentarios, de su
+    `<nombre>.metadata.yaml` o del metadata.yaml del directorio (formato
+    anterior).
+    """
+    artifact = _fresh_artifact(input_path)
+    if artifact is not None:
+        return read_artifact(artifact)
+
+    df = read_file(input_path, **kwargs)
+    metadata = get_csv_metadata(input_path)
+    candidates = [
+        metadata_path(input_path),
+        os.path.join(os.path.dirname(str(input_path)), 'metadata.yaml')
+    ]
+    for path in candidates:
+        if metadata:
+            break
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                metadata = yaml.safe_load(f) or {}
+    df.attrs = metadata
     return df
 
 def get_csv_metadata(file_path: str) -> dict:
@@ -56,4 +598,4 @@ def get_csv_metadata(file_path: str) -> dict:
                 metadata[key.strip()] = value.strip()
             else:
                 break
-    return metadata 
\ No newline at end of file
+    return metadata
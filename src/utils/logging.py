@@ -3,13 +3,19 @@ import pandas as pd
 from functools import wraps
 
 def log_execution_time(func):
+    """Imprime tiempo de pared y de CPU de la función.
+
+    Para métricas por etapa legibles por máquina ver
+    `src.pipeline.StageProfiler`.
+    """
     @wraps(func)
     def wrapper(*args, **kwargs):
-        start_time = time.time()
+        start_time, start_cpu = time.perf_counter(), time.process_time()
         print(f"▶ Iniciando {func.__name__}...")
         result = func(*args, **kwargs)
-        duration = time.time() - start_time
-        print(f"✓ {func.__name__} completado en {duration:.2f}s")
+        duration = time.perf_counter() - start_time
+        cpu = time.process_time() - start_cpu
+        print(f"✓ {func.__name__} completado en {duration:.2f}s (CPU {cpu:.2f}s)")
         return result
     return wrapper
 
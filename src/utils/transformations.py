@@ -1,7 +1,9 @@
 """
 Transformaciones comunes de datos (completado)
 """
+import numpy as np
 import pandas as pd
+from .conversion import ConstantUSDConverter
 
 def to_constant_prices(df, deflator_df, years_params, value_col='pib'):
     """Convierte valores a precios constantes (vectorizado)"""
@@ -12,13 +14,9 @@ def to_constant_prices(df, deflator_df, years_params, value_col='pib'):
         value_name=value_col       # Corregido: value_names -> value_name
     )
     
-    df = df.merge(
-        deflator_df[['year', 'GDPDEF']],
-        on='year',
-        how='left'
-    )
-    
-    df[value_col] = (df[value_col] * 100 / df['GDPDEF']).round(2)
+    # Años sin deflactor quedan en NaN, como con el merge anterior
+    converter = ConstantUSDConverter(deflator_df.set_index('year')['GDPDEF'], strict=False)
+    df[value_col] = converter.convert(df[value_col], df['year']).round(2)
     return df[['year', value_col]].set_index('year').squeeze()
 
 def normalize_to_base_year(series, base_year=2020):
@@ -68,4 +66,56 @@ def clean_column_names(df: pd.DataFrame) -> pd.DataFrame:
         .str.encode('ascii', errors='ignore')
         .str.decode('utf-8')
     )
-    return df 
\ No newline at end of file
+    return df 
+
+
+def splice_panels(observed: pd.DataFrame, blocks, observed_label: str = 'observado'):
+    """
+    Combina una matriz observada (unidades × años) con bloques estimados
+    en una sola pasada vectorizada. Cada bloque cubre las unidades de su
+    índice y los años de sus columnas; sus celdas no nulas reemplazan a
+    las observadas, alineadas por etiqueta (no por posición). Si dos
+    bloques cubren la misma celda gana el último.
+
+    Args:
+        observed: Matriz observada indexada por unidad
+        blocks: dict {nombre: DataFrame} (o lista de pares) de estimaciones
+        observed_label: Etiqueta de procedencia para celdas observadas
+
+    Returns:
+        (matriz combinada, procedencia) con el mismo índice y columnas;
+        la procedencia indica 'observado' o el nombre del bloque
+    """
+    def as_text(df):
+        return df.set_axis(df.columns.map(str), axis=1)
+
+    blocks = list(blocks.items()) if isinstance(blocks, dict) else list(blocks)
+    observed = as_text(observed)
+
+    # Unidades y años de todos los bloques (el orden observado se conserva)
+    index, columns = observed.index, observed.columns
+    for _, block in blocks:
+        index = index.append(block.index.difference(index))
+        columns = columns.append(as_text(block).columns.difference(columns))
+
+    base = observed.reindex(index=index, columns=columns).to_numpy(dtype=np.float64)
+    if not blocks:
+        labels = np.full(base.shape, observed_label, dtype=object)
+        return (pd.DataFrame(base, index=index, columns=columns),
+                pd.DataFrame(labels, index=index, columns=columns))
+
+    stacked = np.stack([
+        as_text(block).reindex(index=index, columns=columns).to_numpy(dtype=np.float64)
+        for _, block in blocks
+    ])
+    covered = ~np.isnan(stacked)
+
+    # Código de procedencia: 0 = observado, k = bloque k (el último gana)
+    last = len(blocks) - 1 - np.argmax(covered[::-1], axis=0)
+    code = np.where(covered.any(axis=0), last + 1, 0)
+    estimated = np.take_along_axis(stacked, np.maximum(code - 1, 0)[None], axis=0)[0]
+    values = np.where(code > 0, estimated, base)
+
+    labels = np.array([observed_label] + [name for name, _ in blocks], dtype=object)
+    return (pd.DataFrame(values, index=index, columns=columns),
+            pd.DataFrame(labels[code], index=index, columns=columns))
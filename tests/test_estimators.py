@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+from src.estimators.population import project_population_matrix  # noqa: E402
+from src.processors.taxes import VEHICLE_TAX_LINE, IncomeCube, aggregate_in_chunks  # noqa: E402
+from src.utils.transformations import splice_panels  # noqa: E402
+
+
+def _legacy_projection(census, rates, years):
+    """Bucle por departamento de la versión anterior de `project_population`"""
+    rows = []
+    for (c1996, c2011, c2023), (tasa_pre, tasa_post) in zip(census, rates, strict=True):
+        anual = pd.DataFrame({"año": years})
+        censos = {1996: int(c1996), 2011: int(c2011), 2023: int(c2023)}
+        anual["poblacion"] = anual["año"].apply(lambda x, censos=censos: censos.get(x, None))
+        anual["poblacion"] = anual["poblacion"].interpolate(method="linear")
+        pre = anual["año"] < 1996
+        anual.loc[pre, "poblacion"] = censos[1996] * (1 + tasa_pre) ** (anual.loc[pre, "año"] - 1996)
+        post = anual["año"] > 2023
+        anual.loc[post, "poblacion"] = censos[2023] * (1 + tasa_post) ** (anual.loc[post, "año"] - 2023)
+        rows.append(anual["poblacion"].round().astype(int).to_numpy())
+    return np.vstack(rows)
+
+
+@pytest.mark.parametrize("start,end", [(1990, 2030), (1996, 2023), (1980, 2040), (1985, 2011)])
+def test_population_matrix_matches_legacy_loop(start, end):
+    rng = np.random.default_rng(0)
+    census = rng.integers(5_000, 1_500_000, size=(6, 3))
+    rates = rng.uniform(-0.02, 0.03, size=(6, 2))
+    years = list(range(start, end + 1))
+
+    projected = project_population_matrix(census, rates, years).round().astype(int)
+
+    np.testing.assert_array_equal(projected, _legacy_projection(census, rates, years))
+
+
+def _income_records(n=2_000):
+    rng = np.random.default_rng(1)
+    lines = [VEHICLE_TAX_LINE, ("Sobre Vehiculos", "Multas"), ("Inmuebles", "Contribucion")]
+    line = rng.integers(0, len(lines), n)
+    return pd.DataFrame({
+        "AÑO": rng.integers(2000, 2010, n),
+        "DEPARTAMENTO": rng.choice(["Montevideo", "Salto", "Rivera", "Rocha"], n),
+        "OBJETO": [lines[i][0] for i in line],
+        "RUBRO": [lines[i][1] for i in line],
+        "RECAUDADO": rng.uniform(0, 1_000, n).round(2),
+    })
+
+
+def test_aggregate_in_chunks_matches_income_cube(tmp_path):
+    records = _income_records()
+    path = tmp_path / "ingresos.csv"
+    records.to_csv(path, index=False)
+    years = {"start": 2002, "end": 2008}
+
+    chunked = aggregate_in_chunks(str(path), *VEHICLE_TAX_LINE, years_params=years, chunksize=137)
+    cube = IncomeCube.from_frame(records).long(*VEHICLE_TAX_LINE, years_params=years)
+
+    assert chunked["AÑO"].tolist() == cube["AÑO"].tolist()
+    assert chunked["DEPARTAMENTO"].tolist() == cube["DEPARTAMENTO"].tolist()
+    np.testing.assert_allclose(chunked["RECAUDADO"], cube["RECAUDADO"], rtol=1e-12)
+
+
+def test_splice_panels_matches_cellwise_replacement():
+    observed = pd.DataFrame(
+        np.arange(12, dtype=float).reshape(3, 4),
+        index=["artigas", "montevideo", "salto"], columns=[2005, 2006, 2007, 2008],
+    )
+    first = pd.DataFrame({"2005": [100.0, np.nan], "2006": [101.0, 102.0]}, index=["montevideo", "salto"])
+    second = pd.DataFrame({"2006": [200.0], "2009": [201.0]}, index=["salto"])
+
+    values, provenance = splice_panels(observed, {"primero": first, "segundo": second})
+
+    expected = observed.set_axis(observed.columns.map(str), axis=1).reindex(columns=values.columns)
+    labels = pd.DataFrame("observado", index=expected.index, columns=expected.columns)
+    for name, block in (("primero", first), ("segundo", second)):
+        for unit, row in block.iterrows():
+            for year, value in row.dropna().items():
+                expected.loc[unit, year] = value
+                labels.loc[unit, year] = name
+
+    pd.testing.assert_frame_equal(values, expected)
+    pd.testing.assert_frame_equal(provenance, labels, check_dtype=False)
+    assert provenance.loc["salto", "2006"] == "segundo"
+    assert provenance.loc["salto", "2005"] == "observado"
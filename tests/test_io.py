@@ -0,0 +1,59 @@
+import datetime
+import os
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("pyarrow")
+pytest.importorskip("openpyxl")
+
+from src.utils import io  # noqa: E402
+
+
+def test_read_cache_hit_with_mixed_object_columns(tmp_path):
+    source = tmp_path / "mixto.xlsx"
+    pd.DataFrame({
+        "valor": [1, "E", 2.5, None],
+        "hora": [datetime.time(15, 30), "15:45", "s/d", datetime.time(9, 0)],
+        "monto": [1.0, 2.0, 3.0, 4.0],
+    }).to_excel(source, index=False)
+
+    expected = io.read_file(str(source), cache=False)
+    before = io.read_cache_stats()
+    io.read_file(str(source))
+    cached = io.read_file(str(source))
+    after = io.read_cache_stats()
+
+    assert after["misses"] - before["misses"] == 1
+    assert after["hits"] - before["hits"] == 1
+    pd.testing.assert_frame_equal(cached, expected)
+    for column in expected.columns:
+        assert cached[column].map(type).tolist() == expected[column].map(type).tolist()
+
+    filtered = io.read_file(str(source), columns=["monto"], filters=[("valor", "==", "E")])
+    assert filtered["monto"].tolist() == [2.0]
+
+
+def _save_in_child(path):
+    future = io.save_with_metadata(pd.DataFrame({"a": [1]}), path, export_csv=True)
+    return future is None and os.path.exists(path)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requiere fork")
+def test_background_writes_are_synchronous_in_forked_workers(tmp_path):
+    import multiprocessing
+
+    with io.background_writes():
+        with multiprocessing.get_context("fork").Pool(1) as pool:
+            assert pool.apply(_save_in_child, (str(tmp_path / "hijo.csv"),))
+
+
+def test_prune_cache_entries_keeps_current_and_in_flight(tmp_path):
+    names = ["x.xlsx.viejo.rates.npz", "x.xlsx.nuevo.rates_v2.npz",
+             "x.xlsx.nuevo.rates_v2.npz.123.tmp.npz", "y.xlsx.otro.rates_v2.npz"]
+    for name in names:
+        (tmp_path / name).write_bytes(b"0")
+
+    io.prune_cache_entries(str(tmp_path / names[1]), "x.xlsx.*.rates*.npz")
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(names[1:])
@@ -0,0 +1,66 @@
+import os
+import time
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+from src.pipeline import Ref, Stage, StageCache, run_pipeline  # noqa: E402
+from src.utils import io  # noqa: E402
+
+
+def _write_frame(path):
+    io.save_with_metadata(pd.DataFrame({"a": [1]}), path, export_csv=True)
+    return "ok"
+
+
+def _suffix(value):
+    return value + "!"
+
+
+def test_waiting_job_takes_over_a_stage_whose_owner_died(tmp_path):
+    cache = StageCache(str(tmp_path / "cache"))
+    output = str(tmp_path / "out" / "a.csv")
+    stage = Stage("a", _write_frame, args=(output,), outputs=[output], params={})
+    key = cache.key(stage, {}, {})
+
+    # Reserva de un proceso que ya no existe
+    with open(cache._lock_path("a", key), "w") as f:
+        f.write("999999999")
+    acquire = cache.acquire
+    attempts = []
+
+    def acquire_after_first_attempt(name, key):
+        attempts.append(name)
+        return len(attempts) > 1 and acquire(name, key)
+
+    cache.acquire = acquire_after_first_attempt
+    assert run_pipeline([stage], cache=cache) == {"a": "ok"}
+    assert cache.lookup(stage, key) == (True, "ok")
+
+
+def test_stage_is_cached_only_after_its_background_writes(tmp_path, monkeypatch):
+    write = io._write_artifacts
+
+    def slow_write(*args, **kwargs):
+        time.sleep(0.2)
+        return write(*args, **kwargs)
+
+    monkeypatch.setattr(io, "_write_artifacts", slow_write)
+    cache = StageCache(str(tmp_path / "cache"))
+    output = str(tmp_path / "out" / "a.csv")
+    stages = [
+        Stage("a", _write_frame, args=(output,), outputs=[output], params={}),
+        Stage("b", _suffix, args=(Ref("a"),), params={}),
+    ]
+    stored = []
+    store = cache.store
+
+    def record_store(stage, key, result):
+        stored.append((stage.name, all(os.path.exists(p) for p in stage.outputs)))
+        return store(stage, key, result)
+
+    cache.store = record_store
+    with io.background_writes():
+        assert run_pipeline(stages, cache=cache) == {"a": "ok", "b": "ok!"}
+    assert ("a", True) in stored
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+pd = pytest.importorskip("pandas")
+sparse = pytest.importorskip("scipy.sparse")
+
+from src.processors.spatial import SpatialWeights  # noqa: E402
+
+
+def _chain():
+    # a - b - c en línea, d aislado
+    queen = sparse.csr_matrix(np.array([
+        [0, 1, 0, 0],
+        [1, 0, 1, 0],
+        [0, 1, 0, 0],
+        [0, 0, 0, 0],
+    ], dtype=np.float32))
+    return SpatialWeights(["a", "b", "c", "d"], queen, queen, np.zeros((4, 4)), np.zeros((4, 2)))
+
+
+def test_lag_renormalizes_over_observed_neighbours():
+    wide = pd.DataFrame({"2020": [1.0, np.nan, 3.0, 5.0], "2021": [2.0, 4.0, np.nan, 1.0]},
+                        index=["a", "b", "c", "d"])
+    lagged = _chain().lag(wide)
+
+    # b promedia solo a y c; a y c solo tienen a b (sin dato en 2020)
+    assert lagged.loc["b", "2020"] == pytest.approx(2.0)
+    assert np.isnan(lagged.loc["a", "2020"])
+    assert lagged.loc["b", "2021"] == pytest.approx(2.0)
+    assert lagged.loc["c", "2021"] == pytest.approx(4.0)
+    # Sin vecinos el rezago es NaN, no cero
+    assert lagged.loc["d"].isna().all()